@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+default_url = "http://ec2-35-180-36-210.eu-west-3.compute.amazonaws.com"
+sweep_columns = ["mileage", "engine_power"]
+
+
+class PricingClient:
+    """
+    Client of the pricing API (`04-api`) shared by every session of the dashboard.
+
+    * one `requests.Session` keeps its connections to the API alive between
+      quotes, up to `pool_size` of them
+    * every call has a `(connect, read)` timeout, and is retried `retries`
+      times with an exponential backoff when the connection fails or the API
+      answers 502, 503 or 504. Predictions are pure so retrying a POST is safe
+    * quotes are memoized, the `cache_size` most recent ones are answered
+      without calling the API for `cache_ttl` seconds. They belong to the model
+      version served, read on `/model` at most every `version_check` seconds,
+      and are all dropped when it changes
+
+    Settings default to the environment variables `API_URL`, `API_TIMEOUT`
+    (read timeout in seconds), `API_RETRIES` and `API_CACHE_TTL`.
+    """
+
+    def __init__(self, base_url: str = None, timeout: float = None, retries: int = None, cache_size: int = 1024, pool_size: int = 10,
+                 cache_ttl: float = None, version_check: float = 10):
+        self.base_url = (base_url or os.environ.get("API_URL", default_url)).rstrip("/")
+        self.timeout = (3.05, timeout or float(os.environ.get("API_TIMEOUT", 10)))
+        retries = int(os.environ.get("API_RETRIES", 3)) if retries is None else retries
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+        self.cache_size = cache_size
+        self.cache_ttl = float(os.environ.get("API_CACHE_TTL", 300)) if cache_ttl is None else cache_ttl
+        self.version_check = version_check
+        self.model_version = None
+        self._version_checked_at = None
+        self._quotes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(car: dict):
+        return tuple(sorted(car.items()))
+
+    def _check_version(self):
+        """
+        Model version served by the API, the memoized quotes are dropped when it changes
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._version_checked_at is not None and now - self._version_checked_at < self.version_check:
+                return self.model_version
+            self._version_checked_at = now
+        try:
+            response = self.session.get(f"{self.base_url}/model", timeout=self.timeout)
+            response.raise_for_status()
+            version = response.json()["active"]["version"]
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            # Without an answer quotes are only expired by their ttl
+            return self.model_version
+        with self._lock:
+            if version != self.model_version:
+                self._quotes.clear()
+                self.model_version = version
+            return version
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._quotes.get(key)
+            if entry is None:
+                return None
+            prediction, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._quotes[key]
+                return None
+            self._quotes.move_to_end(key)
+            return prediction
+
+    def _remember(self, key, prediction, version):
+        with self._lock:
+            # Quoted by a version that was replaced while the request was in flight
+            if version != self.model_version:
+                return
+            self._quotes[key] = (prediction, time.monotonic() + self.cache_ttl)
+            self._quotes.move_to_end(key)
+            while len(self._quotes) > self.cache_size:
+                self._quotes.popitem(last=False)
+
+    def _post(self, path: str, payload):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def quote(self, car: dict) -> float:
+        """
+        Predicted rental price of one car, from `/predict`
+        """
+        version = self._check_version()
+        key = self._key(car)
+        prediction = self._cached(key)
+        if prediction is None:
+            prediction = self._post("/predict", car)["prediction"]
+            self._remember(key, prediction, version)
+        return prediction
+
+    def quotes(self, cars: list) -> tuple:
+        """
+        Predicted prices of many cars. Those not quoted yet are sent together in
+        one `/batch-predict-json` request. Returns the predictions, `None` for
+        invalid cars, and the errors of each car, `None` for valid ones.
+        """
+        version = self._check_version()
+        keys = [self._key(car) for car in cars]
+        predictions = [self._cached(key) for key in keys]
+        errors = [None] * len(cars)
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if missing:
+            answer = self._post("/batch-predict-json", [cars[i] for i in missing])
+            for i, prediction, error in zip(missing, answer["predictions"], answer["errors"]):
+                predictions[i], errors[i] = prediction, error
+                if prediction is not None:
+                    self._remember(keys[i], prediction, version)
+        return predictions, errors
+
+    def compare(self, car: dict, column: str, values) -> pd.DataFrame:
+        """
+        Price curve of `car` when `column` takes each of `values`, in one batched request
+        """
+        if column not in sweep_columns:
+            raise ValueError(f"Unknown column '{column}', expected one of {sweep_columns}")
+        values = [int(value) for value in np.unique(np.rint(values))]
+        predictions, errors = self.quotes([{**car, column: value} for value in values])
+        return pd.DataFrame({column: values, "prediction": predictions, "errors": errors})
+
+    def close(self):
+        self.session.close()
@@ -4,7 +4,14 @@ import plotly.express as px
 import numpy as np
 import streamlit as st
 import io
+import os
+import glob
 import requests
+from data import load_pricing_data, load_delay_data
+from solution import ThresholdEngine, scopes
+from features import delay_features
+from charts import DelayCharts, histogram_figure, pie_figure, box_figure
+from api_client import PricingClient, sweep_columns
 
 # Function to create home page
 st.set_page_config(
@@ -51,18 +58,43 @@ To make an informed decision, we need to gather data insights, and we try to foc
          
 
 # Load the data
-@st.cache_data
-def load_delay_data():
-    data = pd.read_excel('get_around_delay_analysis.xlsx')
+# DELAY_DATA can point to several exports, e.g. "exports/delay_*.xlsx"
+delay_files = [(path, os.path.getmtime(path)) for path in sorted(glob.glob(os.environ.get('DELAY_DATA', 'get_around_delay_analysis.xlsx')))]
+if not delay_files:
+    st.error('No delay export found, check the DELAY_DATA pattern')
+    st.stop()
+
+@st.cache_resource
+def load_delay_export(files):
+    # Keyed on the modification time of every export so an updated file is loaded again.
+    # xlsx exports are parsed once and read from their Arrow copy afterwards, see data.py
+    data = load_delay_data([path for path, _ in files])
     return data
-delay = load_delay_data()
+delay = load_delay_export(delay_files)
 
-@st.cache_data
+@st.cache_resource
 def load_price_data():
-    data = pd.read_csv('get_around_pricing_project.csv')
+    # Read from a memory-mapped Arrow copy of the csv, converted on first run.
+    # cache_resource shares the frame instead of unpickling a copy on every rerun
+    data = load_pricing_data('get_around_pricing_project.csv')
     return data
 price = load_price_data()
 
+@st.cache_resource
+def load_delay_features(files, _data):
+    # Derived once per version of the exports and shared by every tab, see features.py.
+    # Keyed on the files like load_delay_export, hashing the rows would cost more on every rerun than the lookup saves
+    return delay_features(_data)
+delay_new = load_delay_features(delay_files, delay)
+late = delay_new['late']
+
+@st.cache_resource
+def delay_charts(files, _data):
+    # Keyed on the version of the exports, like load_delay_export, the rows themselves are not hashed.
+    # Charts are drawn from these aggregates so their size does not grow with the number of rentals, see charts.py
+    return DelayCharts(_data)
+charts = delay_charts(delay_files, delay_new)
+
 
 with tab2:
   st.write("""
@@ -104,160 +136,134 @@ with tab3:
   ## Data Analysis
   """)
   option = st.selectbox('What would you like to analyze?', ['Numerical variables', 'Categorical variables', 'In-depth analysis'])
-  # In-depth analysis
-  # Histograms for continuous variables
-  # Creating a new column for delay category and displaying its distribution
-  @st.cache_data
-  def delay_category():
-    delay['delay_category'] = 'no delay'
-    delay.loc[delay['delay_at_checkout_in_minutes'] > 0, 'delay_category'] = 'delay < 30 minutes'
-    delay.loc[delay['delay_at_checkout_in_minutes'] >= 30, 'delay_category'] = '30 minutes <= delay < 1 hour'
-    delay.loc[delay['delay_at_checkout_in_minutes'] >= 60, 'delay_category'] = '1 hour <= delay < 2 hours'
-    delay.loc[delay['delay_at_checkout_in_minutes'] >= 120, 'delay_category'] = '2 hours <= delay'
-    return delay
-  
-  @st.cache_data
-  def real_delay():
-    # fill missing values with 720 minutes (12 hours) as per the documentation provided
-    delay['time_delta_with_previous_rental_in_minutes'].fillna(720, inplace=True)
-    # fill missing values with 0 minutes
-    delay['delay_at_checkout_in_minutes'].fillna(0, inplace=True)
-    delay_true = delay[delay['delay_at_checkout_in_minutes'] > 0]
-    delay_false = delay[delay['delay_at_checkout_in_minutes'] <= 0]
-    # Calculating the actual delay in minutes for each rental
-    delay.loc[:,'real_time_delta'] = delay['time_delta_with_previous_rental_in_minutes'] - delay['delay_at_checkout_in_minutes']
-    delay_true.loc[:,'real_time_delta'] = delay_true['time_delta_with_previous_rental_in_minutes'] - delay_true['delay_at_checkout_in_minutes']
-    delay_false.loc[:,'real_time_delta'] = delay_false['time_delta_with_previous_rental_in_minutes'] - delay_false['delay_at_checkout_in_minutes']
-    # Creating a new column 'waited_for_rental' to track if the user waited for the previous rental to be returned
-    delay.loc[:,'waited_for_rental'] = delay['real_time_delta'].apply(lambda x: 1 if x<0 else 0 if x>=0 else np.nan)
-    delay_true.loc[:,'waited_for_rental'] = delay_true['real_time_delta'].apply(lambda x: 1 if x<0 else 0 if x>=0 else np.nan)
-    delay_false.loc[:,'waited_for_rental'] = delay_false['real_time_delta'].apply(lambda x: 1 if x<0 else 0 if x>=0 else np.nan)
-    return delay, delay_true, delay_false
-
-  delay = delay_category()
-  delay_new, delay_true, delay_false = real_delay()
   if option == 'Numerical variables':
-    for col in delay.select_dtypes('float'):
+    for col in charts.numerical:
         if col=='delay_at_checkout_in_minutes':
           col1, col2 = st.columns([1,1])
-          fig = px.histogram(delay, x=col, title=f'Distribution of {col.replace("_", " ")}', marginal='box')
+          fig = histogram_figure(charts.histograms[col], charts.boxes[col], x=col, title=f'Distribution of {col.replace("_", " ")}')
           col1.plotly_chart(fig)
           # Calculating late check-ins percentage
-          late_checkins = delay[delay['delay_at_checkout_in_minutes'] > 0].shape[0]*100/delay.shape[0]
+          late_checkins = late.mean()*100
           col1.caption(f'Percentage of late checkins: {np.round(late_checkins)}')
-          # Plotting the distribution of the delay at checkout after removing outliers
-          Q1 = delay['delay_at_checkout_in_minutes'].quantile(0.25)
-          Q3 = delay['delay_at_checkout_in_minutes'].quantile(0.75)
-          IQR = Q3 - Q1
-          lower = Q1 - 1.5*IQR
-          upper = Q3 + 1.5*IQR
-          fig = px.histogram(delay[delay['delay_at_checkout_in_minutes'].between(Q1,Q3)], x='delay_at_checkout_in_minutes', title=f'Distribution of delay at checkout (no outliers)', marginal='box')
+          # Plotting the distribution of the delay at checkout between the first and third quartiles
+          fig = histogram_figure(charts.typical_delay_histogram, charts.typical_delay_box, x=col, title=f'Distribution of delay at checkout (no outliers)')
           col2.plotly_chart(fig)
         
         else:
-          fig = px.histogram(delay, x=col, title=f'Distribution of {col.replace("_", " ")}', marginal='box')
+          fig = histogram_figure(charts.histograms[col], charts.boxes[col], x=col, title=f'Distribution of {col.replace("_", " ")}')
           st.plotly_chart(fig)
 
   elif option == 'Categorical variables':
     col1, col2 = st.columns([1,1])
     # Pie charts for categorical variables
-    for col in delay.select_dtypes('object'):
+    for col in charts.categorical:
         if col=='delay_category':
-          fig = px.pie(delay, names=col, title=f'Distribution of {col.replace("_", " ")}')
+          fig = pie_figure(charts.counts[col], names=col, title=f'Distribution of {col.replace("_", " ")}')
           col2.plotly_chart(fig)
           # Displaying the number of unique cars
-          unique_cars = delay['car_id'].nunique()
+          unique_cars = delay_new['car_id'].nunique()
           col2.write(f'**Number of unique cars: {unique_cars}**')
         else:
-          fig = px.pie(delay, names=col, title=f'Distribution of {col.replace("_", " ")}')
+          fig = pie_figure(charts.counts[col], names=col, title=f'Distribution of {col.replace("_", " ")}')
           col1.plotly_chart(fig)
 
 
   else:
     col1, col2 = st.columns([1,1])
-    delay_categories = ['no_delay', 'delay < 30 minutes', '30 minutes <= delay < 1 hour', '1 hour <= delay < 2 hours', '2 hours <= delay']
-
     # Bar plots for number of rentals per delay category
-    grouped = delay.groupby(['checkin_type'])['delay_category'].value_counts(normalize=True).reset_index()
-    grouped['count'] = delay.groupby(['checkin_type'])['delay_category'].value_counts().reset_index()['count']
+    grouped = delay_new.groupby(['checkin_type'])['delay_category'].value_counts(normalize=True).reset_index()
+    grouped['count'] = delay_new.groupby(['checkin_type'])['delay_category'].value_counts().reset_index()['count']
     fig = px.bar(grouped, x='checkin_type',y='proportion', color='delay_category', title='Proportion of rentals per delay category')
     col1.plotly_chart(fig)
     fig = px.bar(grouped, x='checkin_type',y='count', color='delay_category', title='Number of rentals per delay category')
     col2.plotly_chart(fig)
 
     # Box plot for distribution of time delta with previous rental in minutes per delay category
-    fig = px.box(delay, x='delay_category', y='time_delta_with_previous_rental_in_minutes', color='delay_category',category_orders={'delay_category':delay_categories}, title='Distribution of time delta with previous rental in minutes per delay category')
+    fig = box_figure(charts.time_delta_boxes, x='delay_category', y='time_delta_with_previous_rental_in_minutes', title='Distribution of time delta with previous rental in minutes per delay category')
     col1.plotly_chart(fig)
 
     # Bar plots for average delay at checkout and time between two rentals per checkin type
-    grouped = delay_true.groupby(['checkin_type'])['delay_at_checkout_in_minutes'].mean().reset_index()
+    grouped = delay_new['delay_at_checkout_in_minutes'].where(late).groupby(delay_new['checkin_type']).mean().reset_index()
     fig = px.bar(grouped, x='checkin_type', y='delay_at_checkout_in_minutes', color='checkin_type', title='Average delay at checkout per checkin type')
     col2.plotly_chart(fig)
-    grouped = delay_true.groupby(['checkin_type'])['time_delta_with_previous_rental_in_minutes'].mean().reset_index()
+    grouped = delay_new['time_delta_with_previous_rental_in_minutes'].where(late).groupby(delay_new['checkin_type']).mean().reset_index()
     fig = px.bar(grouped, x='checkin_type', y='time_delta_with_previous_rental_in_minutes', color='checkin_type', title='Average time between two rentals per checkin type')
     col1.plotly_chart(fig)
 
-    # Calculating the actual delay in minutes for each rental
-    delay.loc[:,'real_time_delta'] = delay['time_delta_with_previous_rental_in_minutes'] - delay['delay_at_checkout_in_minutes']
-    delay_true.loc[:,'real_time_delta'] = delay_true['time_delta_with_previous_rental_in_minutes'] - delay_true['delay_at_checkout_in_minutes']
-
-    # Creating a new column 'waited_for_rental' to track if the user waited for the previous rental to be returned
-    delay.loc[:,'waited_for_rental'] = delay['real_time_delta'].apply(lambda x: 1 if x<0 else 0 if x>=0 else np.nan)
-    delay_true.loc[:,'waited_for_rental'] = delay_true['real_time_delta'].apply(lambda x: 1 if x<0 else 0 if x>=0 else np.nan)
-
     # Bar plot of average time between two rentals per checkin type
-    grouped = delay_true.groupby(['checkin_type'])['real_time_delta'].mean().reset_index()
+    grouped = delay_new['real_time_delta'].where(late).groupby(delay_new['checkin_type']).mean().reset_index()
     fig = px.bar(grouped, x='checkin_type', y='real_time_delta', color='checkin_type', title='Average REAL time between two rentals per checkin type')
     col2.plotly_chart(fig)
 
     # Bar plot of number of drivers that waited for rentals
-    grouped = delay.groupby(['checkin_type'])['waited_for_rental'].value_counts().reset_index()
-    grouped['waited_for_rental'] = grouped['waited_for_rental'].apply(lambda x: 'waited for rental' if x==1 else 'did not wait for rental')
+    grouped = delay_new.groupby(['checkin_type'])['waited_for_rental'].value_counts().reset_index()
+    grouped['waited_for_rental'] = np.where(grouped['waited_for_rental'] == 1, 'waited for rental', 'did not wait for rental')
     fig = px.bar(grouped, x='checkin_type',y='count', color='waited_for_rental', title='Number of drivers that waited for rentals')
     col1.plotly_chart(fig)
 
     # Pie chart of distribution of drivers who waited for rentals
-    fig = px.pie(delay, names='waited_for_rental', title=f'Distribution of drivers who waited for rentals')
+    fig = pie_figure(charts.counts['waited_for_rental'], names='waited_for_rental', title=f'Distribution of drivers who waited for rentals')
     col2.plotly_chart(fig)
 
+@st.cache_resource
+def threshold_engine(files, _data):
+  # Rentals sorted once per version of the exports, every threshold and scope is then answered without filtering them again.
+  # Keyed on the files, the rows are not hashed on every move of the slider
+  return ThresholdEngine(_data)
+
 with tab4:
-  delay_new, delay_true, delay_false = real_delay()
+  engine = threshold_engine(delay_files, delay_new)
   st.write('## Solution analysis')
   # Adding a slider for the minimum delay threshold
   min_delay = st.slider('**Select a minimum delay threshold:**', min_value=0, max_value=720)
-  
-  # Filtering the data based on the selected minimum delay threshold
-  filtered_delay = delay_new[delay_new['time_delta_with_previous_rental_in_minutes'] >= min_delay]
-  filtered_delay_true = delay_true[delay_true['time_delta_with_previous_rental_in_minutes'] >= min_delay]
-  filtered_delay_false = delay_false[delay_false['time_delta_with_previous_rental_in_minutes'] >= min_delay] # Consider fillna for filtered delays
-  
-  st.write(f'### Minimum delay threshold: {min_delay} minutes')
-  impacted_rentals = delay_new[delay_new['time_delta_with_previous_rental_in_minutes'] < min_delay]
-  st.write(f'### Total number of impacted rentals: {impacted_rentals["checkin_type"].count()}') 
-  impacted_connect = delay_new[(delay_new["checkin_type"]=="connect") & (delay_new['time_delta_with_previous_rental_in_minutes'] < min_delay)]
-  st.write(f'### Total number of impacted connect rentals: {impacted_connect["checkin_type"].count()}')
-
-  impacted_mobile = delay_new[(delay_new["checkin_type"]=="mobile") & (delay_new['time_delta_with_previous_rental_in_minutes'] < min_delay)]
-  st.write(f'### Total number of impacted mobile rentals: {impacted_mobile["checkin_type"].count()}')
+  scope = st.radio('**Select a scope:**', scopes, format_func=lambda x: 'All cars' if x == 'all' else 'Connect cars only', horizontal=True)
 
+  # Rentals of each (checkin type, late, waited for rental) group below and above the threshold
+  impacted = engine.below(min_delay).groupby(level='checkin_type').sum()
+  remaining = engine.above(min_delay)
 
+  st.write(f'### Minimum delay threshold: {min_delay} minutes')
+  st.write(f'### Total number of impacted rentals: {int(impacted.sum())}') 
+  st.write(f'### Total number of impacted connect rentals: {int(impacted.get("connect", 0))}')
+  st.write(f'### Total number of impacted mobile rentals: {int(impacted.get("mobile", 0))}')
+  st.write(f'### Number of solved problem cases ({scope} cars): {engine.solved(min_delay, scope)} out of {engine.problem_cases(scope)}')
 
   col1, col2 = st.columns(2)
   # Plotting the total count of rentals per checkin type for the total data
-  fig = px.bar(filtered_delay_false['checkin_type'].value_counts().reset_index(), x='checkin_type',y='count', color='checkin_type', title='Number of rentals without delay per checkin type')
+  grouped = remaining.xs(False, level='late').groupby(level='checkin_type').sum().reset_index(name='count')
+  fig = px.bar(grouped, x='checkin_type',y='count', color='checkin_type', title='Number of rentals without delay per checkin type')
   col1.plotly_chart(fig)
 
   # Plotting the total count of rentals per checkin type for the total data
-  fig = px.bar(filtered_delay_true['checkin_type'].value_counts().reset_index(), x='checkin_type',y='count', color='checkin_type', title='Number of rentals that experienced a delay per checkin type')
+  grouped = remaining.xs(True, level='late').groupby(level='checkin_type').sum().reset_index(name='count')
+  fig = px.bar(grouped, x='checkin_type',y='count', color='checkin_type', title='Number of rentals that experienced a delay per checkin type')
   col2.plotly_chart(fig)
 
-  # Plotting the average delay at checkout per checkin type for the filtered data
-  # Grouping the filtered data by checkin type
-  grouped = filtered_delay.groupby('checkin_type')['waited_for_rental'].value_counts().reset_index()
+  # Number of rentals that waited for the previous rental per checkin type, above the threshold
+  grouped = remaining.groupby(level=['checkin_type', 'waited_for_rental']).sum().reset_index(name='count')
   fig = px.bar(grouped, x='checkin_type', y='count', color='waited_for_rental', title='Number of rentals that waited for the previous rental to be returned per checkin type')
   col1.plotly_chart(fig)
 
+  # Share of impacted rentals and solved problem cases for every threshold, computed in one pass
+  curve = engine.curve(scope=scope)
+  fig = px.line(curve, x='threshold', y=['impacted_share', 'solved_share'], title=f'Impacted rentals and solved problem cases per threshold ({scope} cars)')
+  fig.add_vline(x=min_delay, line_dash='dash')
+  col2.plotly_chart(fig)
+
+@st.cache_resource
+def pricing_client():
+    # One pooled keep-alive session and quote cache shared by every session, see api_client.py
+    return PricingClient()
+
+def api_error(error):
+    # The API explains its 422 answers in "detail"
+    try:
+        return error.response.json()["detail"]
+    except (AttributeError, ValueError, KeyError, TypeError):
+        return str(error)
+
 with tab5:
+    client = pricing_client()
     st.write("""
     ## Car Price Prediction
     Fill in the details about the car to get a predicted rental price.
@@ -289,31 +295,53 @@ with tab5:
         # When the user hits submit, call the API with these values and display the prediction
         submit_button = st.form_submit_button(label="Predict Price")
 
-        if submit_button:
-            # Prepare the data for the API
-            df = pd.DataFrame({
-                "model_key": model_key,
-                "mileage": mileage,
-                "engine_power": engine_power,
-                "fuel": fuel,
-                "paint_color": paint_color,
-                "car_type": car_type,
-                "private_parking_available": private_parking_available,
-                "has_gps": has_gps,
-                "has_air_conditioning": has_air_conditioning,
-                "automatic_car": automatic_car,
-                "has_getaround_connect": has_getaround_connect,
-                "has_speed_regulator": has_speed_regulator,
-                "winter_tires": winter_tires
-            }, index=[0])
-            
-            data = df.to_dict(orient='records')[0]
-            # Make sure your API is able to receive POST requests
-            response = requests.post('http://ec2-35-180-36-210.eu-west-3.compute.amazonaws.com/predict', json=data)
-            # Display the prediction
-            st.write("### Predicted Price")
-            st.write(f"Based on the information provided, the estimated rental price is: {int(response.json()['prediction'])} $")
-
-
+        # Form values are the last submitted ones, they are also the base car of the comparison
+        car = {
+            "model_key": model_key,
+            "mileage": mileage,
+            "engine_power": engine_power,
+            "fuel": fuel,
+            "paint_color": paint_color,
+            "car_type": car_type,
+            "private_parking_available": private_parking_available,
+            "has_gps": has_gps,
+            "has_air_conditioning": has_air_conditioning,
+            "automatic_car": automatic_car,
+            "has_getaround_connect": has_getaround_connect,
+            "has_speed_regulator": has_speed_regulator,
+            "winter_tires": winter_tires
+        }
 
+        if submit_button:
+            # Quote the car, a car already quoted is answered by the client without calling the API
+            try:
+                prediction = client.quote(car)
+            except requests.RequestException as e:
+                st.error(f"The pricing API could not be reached: {api_error(e)}")
+            else:
+                # Display the prediction
+                st.write("### Predicted Price")
+                st.write(f"Based on the information provided, the estimated rental price is: {int(prediction)} $")
 
+    st.write("""
+    ## Compare configurations
+    Price of the car above for a range of mileages or engine powers, all sent to the API in one request.
+    """)
+    column = st.radio("Vary", sweep_columns, format_func=lambda x: x.replace("_", " ").capitalize(), horizontal=True)
+    with st.form(key="compare_form"):
+        # Bounded by the values seen in the pricing dataset
+        low, high = st.slider("Range", min_value=0, max_value=int(price[column].max()), value=(0, int(price[column].quantile(0.99))), key=f"range_{column}")
+        points = st.slider("Number of configurations", min_value=2, max_value=200, value=50)
+        compare_button = st.form_submit_button(label="Compare")
+
+    if compare_button:
+        try:
+            curve = client.compare(car, column, np.linspace(low, high, points))
+        except requests.RequestException as e:
+            st.error(f"The pricing API could not be reached: {api_error(e)}")
+        else:
+            fig = px.line(curve.dropna(subset=["prediction"]), x=column, y="prediction", markers=True, title=f"Predicted rental price per {column.replace('_', ' ')}")
+            st.plotly_chart(fig)
+            invalid = curve[curve["prediction"].isna()]
+            if len(invalid):
+                st.warning(f"{len(invalid)} configurations were rejected by the API: {invalid['errors'].iloc[0]}")
@@ -0,0 +1,97 @@
+"""
+Load time of the delay dataset, xlsx through openpyxl vs its Arrow copy.
+
+Each scenario runs in a fresh interpreter, as on a cold start of the dashboard:
+
+* `xlsx`: `pd.read_excel`, what the dashboard used to do on every start
+* `first`: `data.load_delay_data` on an empty cache, parses the xlsx and writes the Arrow copy
+* `cached`: `data.load_delay_data` once the Arrow copy exists, openpyxl is not imported
+
+`--months` concatenates that many copies of the export, with new rental ids,
+to measure a larger multi-month export.
+
+    python benchmarks/ingest.py --months 1 6 --output ingest.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORT = os.path.join(APP_DIR, "get_around_delay_analysis.xlsx")
+
+probe = """
+import json, sys, time
+start = time.perf_counter()
+import pandas as pd
+import data
+if sys.argv[1] == "xlsx":
+    df = pd.read_excel(sys.argv[2])
+else:
+    df = data.load_delay_data(sys.argv[2])
+print(json.dumps({
+    "load_seconds": time.perf_counter() - start,
+    "rows": len(df),
+    "openpyxl_imported": "openpyxl" in sys.modules,
+}))
+"""
+
+
+def run_scenario(name: str, export: str, cache_dir: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", probe, name, export],
+        cwd=APP_DIR,
+        env={**os.environ, "DATA_CACHE_DIR": cache_dir},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {"scenario": name, **json.loads(completed.stdout.strip().splitlines()[-1])}
+
+
+def multi_month_export(months: int, path: str) -> str:
+    """
+    `months` copies of the export with distinct rental ids, written to `path`
+    """
+    data = pd.read_excel(EXPORT)
+    step = int(data["rental_id"].max()) + 1
+    frames = []
+    for month in range(months):
+        frame = data.copy()
+        frame["rental_id"] += month * step
+        frame["previous_ended_rental_id"] += month * step
+        frames.append(frame)
+    pd.concat(frames, ignore_index=True).to_excel(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", nargs="+", type=int, default=[1], help="sizes of the export, in months of data")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each scenario")
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for months in args.months:
+            export = EXPORT if months == 1 else multi_month_export(months, os.path.join(workdir, f"delay_{months}_months.xlsx"))
+            cache_dir = os.path.join(workdir, f"cache_{months}")
+            runs = [run_scenario("xlsx", export, cache_dir) for _ in range(args.repeat)]
+            runs.append(run_scenario("first", export, cache_dir))
+            runs += [run_scenario("cached", export, cache_dir) for _ in range(args.repeat)]
+            for run in runs:
+                run["months"] = months
+                print(f"{months:>3} months, {run['scenario']:>6}: {run['load_seconds']:.2f}s for {run['rows']} rows, openpyxl {'imported' if run['openpyxl_imported'] else 'not imported'}")
+            results += runs
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
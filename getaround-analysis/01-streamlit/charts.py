@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+def histogram(values: pd.Series, max_bins: int = 100) -> pd.DataFrame:
+    """
+    Binned counts of `values`, one row per bin with its `left` and `right` edges.
+
+    Bins follow numpy's "auto" rule, capped at `max_bins` so a few extreme
+    values do not produce thousands of bins. Missing values are left out.
+    """
+    finite = values.to_numpy(dtype=np.float64)
+    finite = finite[np.isfinite(finite)]
+    edges = np.histogram_bin_edges(finite, bins="auto")
+    if len(edges) - 1 > max_bins:
+        edges = np.histogram_bin_edges(finite, bins=max_bins)
+    counts, edges = np.histogram(finite, bins=edges)
+    return pd.DataFrame({"left": edges[:-1], "right": edges[1:], "count": counts})
+
+
+def box_stats(values: pd.Series) -> dict:
+    """
+    Summary statistics drawn by a box plot: quartiles, mean, and whiskers at
+    the most extreme values within 1.5 IQR of the box, as plotly computes them.
+    """
+    finite = values.to_numpy(dtype=np.float64)
+    finite = finite[np.isfinite(finite)]
+    q1, median, q3 = np.quantile(finite, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = finite[(finite >= q1 - 1.5 * iqr) & (finite <= q3 + 1.5 * iqr)]
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "mean": finite.mean(),
+        "lowerfence": inside.min(),
+        "upperfence": inside.max(),
+        "count": len(finite),
+    }
+
+
+def category_counts(values: pd.Series) -> pd.DataFrame:
+    """
+    Number of rows per category, in the order of the categories for categoricals
+    """
+    counts = values.value_counts(sort=not isinstance(values.dtype, pd.CategoricalDtype))
+    return counts.rename_axis(values.name).reset_index(name="count")
+
+
+class DelayCharts:
+    """
+    Chart data of the "Data Analysis" tab, aggregated once per version of the
+    delay dataset.
+
+    Figures are built from these aggregates only, so what is sent to the browser
+    on every rerun is a few hundred bins and counts whatever the number of
+    rentals, instead of every rental.
+    """
+
+    def __init__(self, delay: pd.DataFrame):
+        self.numerical = list(delay.select_dtypes("float").columns)
+        self.categorical = list(delay.select_dtypes(["object", "category"]).columns)
+        self.histograms = {col: histogram(delay[col]) for col in self.numerical}
+        self.boxes = {col: box_stats(delay[col]) for col in self.numerical}
+        self.counts = {col: category_counts(delay[col]) for col in self.categorical + ["waited_for_rental"]}
+
+        # Delay at checkout between the first and third quartiles, without the outliers
+        checkout_delay = delay["delay_at_checkout_in_minutes"]
+        q1, q3 = checkout_delay.quantile([0.25, 0.75])
+        typical = checkout_delay[checkout_delay.between(q1, q3)]
+        self.typical_delay_histogram = histogram(typical)
+        self.typical_delay_box = box_stats(typical)
+
+        time_delta = delay.groupby("delay_category", observed=False)["time_delta_with_previous_rental_in_minutes"]
+        self.time_delta_boxes = {category: box_stats(values) for category, values in time_delta if len(values)}
+
+
+def histogram_figure(hist: pd.DataFrame, box: dict, x: str, title: str) -> go.Figure:
+    """
+    Histogram with a box plot above it, like `px.histogram(..., marginal='box')`
+    """
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.02)
+    fig.add_trace(go.Box(
+        y=[x], orientation="h", name=x, boxpoints=False, showlegend=False,
+        q1=[box["q1"]], median=[box["median"]], q3=[box["q3"]], mean=[box["mean"]],
+        lowerfence=[box["lowerfence"]], upperfence=[box["upperfence"]],
+    ), row=1, col=1)
+    fig.add_trace(go.Bar(
+        x=(hist["left"] + hist["right"]) / 2, y=hist["count"], width=hist["right"] - hist["left"],
+        name=x, showlegend=False,
+    ), row=2, col=1)
+    fig.update_layout(title=title, bargap=0)
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
+    fig.update_yaxes(title_text="count", row=2, col=1)
+    fig.update_xaxes(title_text=x, row=2, col=1)
+    return fig
+
+
+def pie_figure(counts: pd.DataFrame, names: str, title: str) -> go.Figure:
+    return px.pie(counts, names=names, values="count", title=title)
+
+
+def box_figure(boxes: dict, x: str, y: str, title: str) -> go.Figure:
+    """
+    One box per key of `boxes`, like `px.box(..., x=x, y=y, color=x)`
+    """
+    fig = go.Figure()
+    for category, box in boxes.items():
+        fig.add_trace(go.Box(
+            x=[category], name=str(category), boxpoints=False,
+            q1=[box["q1"]], median=[box["median"]], q3=[box["q3"]], mean=[box["mean"]],
+            lowerfence=[box["lowerfence"]], upperfence=[box["upperfence"]],
+        ))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y, legend_title_text=x)
+    return fig
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.feather as feather
+
+cache_dir = os.environ.get("DATA_CACHE_DIR", "data_cache")
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def columnar_path(source_path: str) -> str:
+    """
+    Arrow copy of a source file, named after its content so any change to the source produces a new file
+    """
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, f"{stem}.{file_digest(source_path)[:16]}.arrow")
+
+
+def load_columnar(source_path: str, convert):
+    """
+    Load `source_path` from its memory-mapped Arrow copy, `convert(source_path)`
+    builds the dataframe the first time
+    """
+    path = columnar_path(source_path)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(convert(source_path), tmp, compression="uncompressed")
+        os.replace(tmp, path)
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def read_pricing_csv(csv_path: str):
+    """
+    Pricing csv with text columns as categoricals and flags as booleans
+    """
+    data = pd.read_csv(csv_path)
+    data.drop(columns=["Unnamed: 0"], inplace=True, errors="ignore")
+    for column in ["model_key", "fuel", "paint_color", "car_type"]:
+        data[column] = data[column].astype("category")
+    return data
+
+
+def load_pricing_data(csv_path: str = "get_around_pricing_project.csv"):
+    return load_columnar(csv_path, read_pricing_csv)
+
+
+def read_delay_export(path: str):
+    """
+    Rentals of a delay export (xlsx, first sheet, or csv) with typed columns:
+    text as categoricals and rental ids as nullable integers
+    """
+    if path.endswith(".csv"):
+        data = pd.read_csv(path)
+    else:
+        data = pd.read_excel(path, sheet_name=0, engine="openpyxl")
+    for column in ["checkin_type", "state"]:
+        data[column] = data[column].astype("category")
+    data["previous_ended_rental_id"] = data["previous_ended_rental_id"].astype("Int64")
+    return data
+
+
+def load_delay_data(paths="get_around_delay_analysis.xlsx"):
+    """
+    One or several delay exports (e.g. one per month), each converted once to
+    its own Arrow copy, so openpyxl only runs for new or modified files.
+    Rentals present in several exports are kept once, from the last file.
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    frames = [load_columnar(path, read_delay_export) for path in paths]
+    if len(frames) == 1:
+        return frames[0]
+    # Categories differ between exports, concatenating them as is would fall back to object columns
+    for column in ["checkin_type", "state"]:
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    data = pd.concat(frames, ignore_index=True)
+    return data.drop_duplicates("rental_id", keep="last", ignore_index=True)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+delay_categories = ['no delay', 'delay < 30 minutes', '30 minutes <= delay < 1 hour', '1 hour <= delay < 2 hours', '2 hours <= delay']
+
+
+def delay_features(delay: pd.DataFrame) -> pd.DataFrame:
+    """
+    Derived columns of the delay dataset, computed column-wise in one pass.
+
+    Returns a new dataframe, `delay` is left untouched so it can be cached and shared:
+
+    * missing `time_delta_with_previous_rental_in_minutes` are filled with 720 minutes (12 hours) as per the documentation
+    * missing `delay_at_checkout_in_minutes` are filled with 0 minutes
+    * `late`: the car was returned late
+    * `delay_category`: bucket of the delay at checkout, one of `delay_categories`
+    * `real_time_delta`: time left between the actual checkout and the next checkin
+    * `waited_for_rental`: 1 when the next driver had to wait for the car, 0 otherwise
+    """
+    time_delta = delay['time_delta_with_previous_rental_in_minutes'].fillna(720).to_numpy()
+    checkout_delay = delay['delay_at_checkout_in_minutes'].fillna(0).to_numpy()
+    real_time_delta = time_delta - checkout_delay
+    # Codes of `delay_categories`, the labels are only attached by the categorical
+    category = np.select(
+        [checkout_delay >= 120, checkout_delay >= 60, checkout_delay >= 30, checkout_delay > 0],
+        [4, 3, 2, 1],
+        default=0,
+    )
+    return delay.assign(**{
+        'time_delta_with_previous_rental_in_minutes': time_delta,
+        'delay_at_checkout_in_minutes': checkout_delay,
+        'late': checkout_delay > 0,
+        'delay_category': pd.Categorical.from_codes(category, categories=delay_categories),
+        'real_time_delta': real_time_delta,
+        'waited_for_rental': np.where(real_time_delta < 0, 1, 0),
+    })
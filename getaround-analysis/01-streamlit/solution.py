@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+scopes = ["all", "connect"]
+
+
+class ThresholdEngine:
+    """
+    Answers the "Solution Analysis" questions for any minimum delay threshold
+    without filtering the rentals again.
+
+    Rentals are sorted once by `time_delta_with_previous_rental_in_minutes` and
+    a cumulative count is kept for every (checkin type, late at checkout, waited
+    for rental) group: row `i` of `cumulative` holds the number of rentals of
+    each group among the `i` smallest deltas. The rentals with a delta below a
+    threshold are then one binary search away, and a whole threshold curve is a
+    single `searchsorted` over every threshold.
+
+    A rental is impacted by a threshold when its delta with the previous rental
+    is below it. An impacted rental whose driver waited for the car is a problem
+    case solved by the threshold. Rentals without a delta are never impacted.
+    """
+
+    def __init__(self, delay: pd.DataFrame):
+        deltas = delay["time_delta_with_previous_rental_in_minutes"].to_numpy(dtype=np.float64)
+        order = np.argsort(deltas, kind="stable")
+        # NaN sort last and are never below a threshold
+        self.deltas = deltas[order]
+
+        checkin_type = pd.Categorical(delay["checkin_type"])
+        self.checkin_types = list(checkin_type.categories)
+        late = delay["delay_at_checkout_in_minutes"].to_numpy(dtype=np.float64) > 0
+        waited = delay["waited_for_rental"].to_numpy(dtype=np.float64) == 1
+        groups = (checkin_type.codes.astype(np.int64) * 2 + late) * 2 + waited
+        self.n_groups = len(self.checkin_types) * 4
+
+        one_hot = np.zeros((len(delay) + 1, self.n_groups), dtype=np.int64)
+        one_hot[np.arange(1, len(delay) + 1), groups[order]] = 1
+        self.cumulative = np.cumsum(one_hot, axis=0)
+        self.totals = self.cumulative[-1]
+
+        self.groups = pd.MultiIndex.from_product(
+            [self.checkin_types, [False, True], [False, True]],
+            names=["checkin_type", "late", "waited_for_rental"],
+        )
+        self.waited = self.groups.get_level_values("waited_for_rental").to_numpy(dtype=bool)
+
+    def _in_scope(self, scope: str) -> np.ndarray:
+        if scope not in scopes:
+            raise ValueError(f"Unknown scope '{scope}', expected one of {scopes}")
+        if scope == "all":
+            return np.ones(self.n_groups, dtype=bool)
+        return self.groups.get_level_values("checkin_type") == "connect"
+
+    def _position(self, threshold):
+        return np.searchsorted(self.deltas, threshold, side="left")
+
+    def below(self, threshold: float) -> pd.Series:
+        """
+        Number of rentals of each group with a delta below `threshold`, O(log n)
+        """
+        return pd.Series(self.cumulative[self._position(threshold)], index=self.groups)
+
+    def above(self, threshold: float) -> pd.Series:
+        """
+        Number of rentals of each group still possible with `threshold`
+        """
+        return pd.Series(self.totals - self.cumulative[self._position(threshold)], index=self.groups)
+
+    def impacted(self, threshold: float, scope: str = "all") -> int:
+        return int(self.cumulative[self._position(threshold), self._in_scope(scope)].sum())
+
+    def solved(self, threshold: float, scope: str = "all") -> int:
+        return int(self.cumulative[self._position(threshold), self._in_scope(scope) & self.waited].sum())
+
+    def rentals(self, scope: str = "all") -> int:
+        return int(self.totals[self._in_scope(scope)].sum())
+
+    def problem_cases(self, scope: str = "all") -> int:
+        """
+        Rentals whose driver waited for the car, whatever the threshold
+        """
+        return int(self.totals[self._in_scope(scope) & self.waited].sum())
+
+    def curve(self, thresholds=None, scope: str = "all") -> pd.DataFrame:
+        """
+        Impacted rentals and solved problem cases for every threshold, by default every minute from 0 to 720
+        """
+        thresholds = np.arange(0, 721) if thresholds is None else np.asarray(thresholds)
+        in_scope = self._in_scope(scope)
+        counts = self.cumulative[self._position(thresholds)]
+        impacted = counts[:, in_scope].sum(axis=1)
+        solved = counts[:, in_scope & self.waited].sum(axis=1)
+        rentals, problems = self.rentals(scope), self.problem_cases(scope)
+        return pd.DataFrame({
+            "threshold": thresholds,
+            "impacted": impacted,
+            "impacted_share": impacted / rentals if rentals else 0.0,
+            "solved": solved,
+            "solved_share": solved / problems if problems else 0.0,
+        })
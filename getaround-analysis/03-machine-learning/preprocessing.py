@@ -0,0 +1,13 @@
+"""
+Functions used inside the pricing pipelines.
+
+They live in their own module, not in a script: joblib hashes and pickles the
+pipelines by reference in its worker processes, where a function defined in
+`__main__` cannot be found. Shared by `train.py` and `04-api/benchmarks/load.py`.
+"""
+
+
+def bool_to_numeric(col):
+    """Transform boolean values into numeric values"""
+    # The notebook's `col.replace({True: 1, False: 0})` fails on boolean frames with pandas 3
+    return col.astype(int)
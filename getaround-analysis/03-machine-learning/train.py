@@ -0,0 +1,214 @@
+"""
+Training of the pricing model, the runs of `pricing_project.ipynb` as a script.
+
+Every model is a `Pipeline(preprocessor, regressor)` fitted on 70% of the
+pricing dataset and scored on the remaining 30%, each one in its own MLflow run
+of the `getaround_pricing_project` experiment with its parameters, the train
+and test metrics and the wall-clock time of its training.
+
+Hyperparameter searches (`*_search` models) use successive halving: every
+candidate is cross-validated on a small share of the rows and only the best
+third goes on to the next round with three times more rows, until the last
+round uses them all. Candidates run in parallel on `--n-jobs` cores. The
+pipelines share a joblib cache (`--cache-dir`), so the preprocessing of a fold
+is fitted once and reused by every candidate evaluated on that fold.
+
+    python train.py                                  # every model
+    python train.py --models xgbr_search --register  # register the best xgbr as `getaround_xgbr`
+
+MLflow settings come from `MLFLOW_TRACKING_URI` (see `secrets.sh`) or `--tracking-uri`.
+"""
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import cloudpickle
+import mlflow
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.feature_selection import SelectKBest, f_regression
+from sklearn.linear_model import ElasticNet, Lasso, LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import HalvingGridSearchCV, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+from xgboost import XGBRegressor
+import preprocessing
+from preprocessing import bool_to_numeric
+
+experiment_name = "getaround_pricing_project"
+model_name = "getaround_xgbr"
+target_variable = "rental_price_per_day"
+
+# Regressors trained as is, in the order of the notebook
+baselines = {
+    "linear_regression_baseline": lambda: LinearRegression(),
+    "decision_tree": lambda: DecisionTreeRegressor(max_depth=10, random_state=42),
+    "random_forest": lambda: RandomForestRegressor(max_depth=10, random_state=42),
+    "ridge": lambda: Ridge(alpha=1, random_state=42),
+    "lasso": lambda: Lasso(alpha=1, random_state=42),
+    "elasticnet": lambda: ElasticNet(alpha=1, random_state=42),
+    "random_forest_feature_selection_40": lambda: RandomForestRegressor(max_depth=10, random_state=42),
+    "xgbr": lambda: XGBRegressor(n_estimators=200, max_depth=7, eta=0.1, subsample=0.7, colsample_bytree=0.8, alpha=0.1, random_state=42),
+}
+
+# Regressors and the grid of parameters searched
+searches = {
+    "random_forest_search": (
+        lambda: RandomForestRegressor(random_state=42, n_jobs=1),
+        {
+            "max_depth": [10, 12, 14, 16, 18, 20],
+            "min_samples_split": [2, 4, 8, 10, 12, 14, 16],
+            "n_estimators": [60, 80, 100, 200, 300, 400, 500],
+        },
+    ),
+    "xgbr_search": (
+        lambda: XGBRegressor(alpha=0.1, random_state=42, n_jobs=1),
+        {
+            "n_estimators": [100, 200, 400],
+            "max_depth": [5, 7, 9],
+            "eta": [0.05, 0.1, 0.2],
+            "subsample": [0.7, 0.9],
+            "colsample_bytree": [0.8, 1.0],
+        },
+    ),
+}
+models = list(baselines) + list(searches)
+
+
+def load_prices(path: str) -> pd.DataFrame:
+    data = pd.read_csv(path)
+    # it's easier to work with the columns when all their names are in lowercase
+    data.columns = data.columns.str.lower()
+    return data.drop(columns=["unnamed: 0"], errors="ignore")
+
+
+def feature_types(X: pd.DataFrame):
+    """
+    Names of the numeric, categorical and boolean columns of `X`
+    """
+    numeric_features = list(X.select_dtypes("number").columns)
+    bool_features = list(X.select_dtypes("bool").columns)
+    categorical_features = [col for col in X.columns if col not in numeric_features + bool_features]
+    return numeric_features, categorical_features, bool_features
+
+
+def make_pipeline(name: str, regressor, features, memory=None) -> Pipeline:
+    numeric_features, categorical_features, bool_features = features
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("num", StandardScaler(), numeric_features),
+            ("cat", OneHotEncoder(drop="first", handle_unknown="ignore"), categorical_features),
+            ("bool", FunctionTransformer(bool_to_numeric), bool_features),
+        ])
+    steps = [("preprocessor", preprocessor)]
+    if name == "random_forest_feature_selection_40":
+        steps.append(("feature_selector", SelectKBest(f_regression, k=40)))
+    steps.append(("regressor", regressor))
+    # The fitted preprocessor is cached in `memory`, keyed by its parameters and the rows it is fitted on
+    return Pipeline(steps=steps, memory=memory)
+
+
+def regression_metrics(prefix: str, Y, Y_pred) -> dict:
+    return {
+        f"{prefix}_r2_score": r2_score(Y, Y_pred),
+        f"{prefix}_mean_absolute_error": mean_absolute_error(Y, Y_pred),
+        f"{prefix}_mean_squared_error": mean_squared_error(Y, Y_pred),
+        f"{prefix}_root_mean_squared_error": np.sqrt(mean_squared_error(Y, Y_pred)),
+    }
+
+
+def train(name: str, X_train, X_test, Y_train, Y_test, memory=None, cv: int = 5, n_jobs: int = -1, register: bool = False) -> dict:
+    """
+    Fit model `name` in its own MLflow run, returns its metrics and wall-clock time
+    """
+    features = feature_types(X_train)
+    with mlflow.start_run(run_name=name):
+        start = time.perf_counter()
+        if name in searches:
+            regressor, grid = searches[name]
+            model = HalvingGridSearchCV(
+                make_pipeline(name, regressor(), features, memory),
+                {f"regressor__{param}": values for param, values in grid.items()},
+                factor=3,
+                min_resources="exhaust",
+                cv=cv,
+                n_jobs=n_jobs,
+                random_state=42,
+            )
+            model.fit(X_train, Y_train)
+            mlflow.log_param("best_params", model.best_params_)
+            mlflow.log_metric("search_iterations", model.n_iterations_)
+            mlflow.log_metric("search_candidates", len(model.cv_results_["params"]))
+            pipeline = model.best_estimator_
+        else:
+            pipeline = make_pipeline(name, baselines[name](), features, memory)
+            pipeline.fit(X_train, Y_train)
+        wall_clock = time.perf_counter() - start
+        print(f"{name}: trained in {wall_clock:.1f}s")
+
+        metrics = {
+            **regression_metrics("training", Y_train, pipeline.predict(X_train)),
+            **regression_metrics("testing", Y_test, pipeline.predict(X_test)),
+            "wall_clock_seconds": wall_clock,
+        }
+        mlflow.log_metrics(metrics)
+
+        # The cache only speeds up fitting, the logged model does not depend on it
+        pipeline.set_params(memory=None)
+        registered = register and isinstance(pipeline.named_steps["regressor"], XGBRegressor)
+        # The API cannot import `preprocessing`, its functions are saved by value with the model.
+        # Only while logging: the search workers import the module and must keep pickling it by reference
+        cloudpickle.register_pickle_by_value(preprocessing)
+        try:
+            mlflow.sklearn.log_model(
+                pipeline, name="model", input_example=X_train.head(), serialization_format="cloudpickle",
+                registered_model_name=model_name if registered else None,
+            )
+        finally:
+            cloudpickle.unregister_pickle_by_value(preprocessing)
+    return {"model": name, **metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="get_around_pricing_project.csv", help="pricing dataset")
+    parser.add_argument("--models", nargs="+", choices=models, default=models, help="models to train")
+    parser.add_argument("--cv", type=int, default=5, help="number of folds of the searches")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="candidates evaluated in parallel, -1 uses every core")
+    parser.add_argument("--cache-dir", help="directory of the preprocessing cache (default: a temporary directory), `none` disables it")
+    parser.add_argument("--tracking-uri", help="MLflow tracking server (default: MLFLOW_TRACKING_URI)")
+    parser.add_argument("--register", action="store_true", help=f"register the XGBoost models as `{model_name}`")
+    parser.add_argument("--output", help="json file where the metrics and wall-clock times are saved")
+    args = parser.parse_args()
+
+    if args.tracking_uri:
+        mlflow.set_tracking_uri(args.tracking_uri)
+    mlflow.set_experiment(experiment_name)
+    # Parameters and search results, metrics and models are logged by `train`
+    mlflow.sklearn.autolog(log_models=False, log_datasets=False, log_post_training_metrics=False, silent=True)
+
+    prices = load_prices(args.data)
+    X = prices.drop(target_variable, axis=1)
+    Y = prices.loc[:, target_variable]
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.3, random_state=42, shuffle=True)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        memory = None if args.cache_dir == "none" else args.cache_dir or workdir
+        results = [
+            train(name, X_train, X_test, Y_train, Y_test, memory=memory, cv=args.cv, n_jobs=args.n_jobs, register=args.register)
+            for name in args.models
+        ]
+
+    print(pd.DataFrame(results).set_index("model")[["testing_r2_score", "testing_root_mean_squared_error", "wall_clock_seconds"]].round(3).to_string())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import copy
+import numpy as np
+import pandas as pd
+
+group_methods = ["mean", "median", "max", "min", "sum", "count"]
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class AggregateStore:
+    """
+    Every `df.groupby(column).<method>()` of the dataset, computed once and kept
+    serialized in memory so `/groupby` does no pandas work per request.
+
+    When the dataset is reloaded with rows appended at the end, `count`, `sum`,
+    `min`, `max` and `mean` are updated from the new rows only, `median` is
+    recomputed. Any other change rebuilds everything.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.build(df)
+
+    def _partials(self, df):
+        numeric = df.select_dtypes(["number", "bool"]).columns
+        partials = {}
+        for column in self.columns:
+            grouped = df.groupby(column, observed=True)
+            values = [c for c in numeric if c != column]
+            partials[column] = {
+                "count": grouped.count(),
+                "numeric_count": grouped[values].count(),
+                "sum": grouped[values].sum(),
+                "min": grouped.min(),
+                "max": grouped.max(),
+            }
+        return partials
+
+    def _finalize(self, df):
+        # Built aside and swapped in at once, requests never see a half refreshed store
+        tables, payloads = {}, {}
+        for column, partial in self._partials_by_column.items():
+            values = partial["sum"].columns
+            by_method = {
+                "count": partial["count"],
+                "sum": partial["sum"],
+                "min": partial["min"],
+                "max": partial["max"],
+                "mean": partial["sum"] / partial["numeric_count"],
+                "median": df.groupby(column, observed=True)[list(values)].median(),
+            }
+            for method, table in by_method.items():
+                tables[column, method] = table
+                payloads[column, method] = table.to_json()
+        self.tables, self.payloads = tables, payloads
+
+    def build(self, df):
+        """
+        Compute every aggregate from scratch
+        """
+        self._partials_by_column = self._partials(df)
+        self._finalize(df)
+        self._hashes = row_hashes(df)
+
+    def refresh(self, df) -> str:
+        """
+        Bring the aggregates up to date with a reloaded dataset, returns how it was done
+        """
+        hashes = row_hashes(df)
+        n = len(self._hashes)
+        if len(hashes) == n and (hashes == self._hashes).all():
+            return "unchanged"
+        if len(hashes) < n or not (hashes[:n] == self._hashes).all():
+            self.build(df)
+            return "rebuilt"
+
+        added = self._partials(df.iloc[n:])
+        for column, partial in self._partials_by_column.items():
+            for name, how in [("count", "sum"), ("numeric_count", "sum"), ("sum", "sum"), ("min", "min"), ("max", "max")]:
+                merged = pd.concat([partial[name], added[column][name]])
+                partial[name] = getattr(merged.groupby(level=0), how)()
+        self._finalize(df)
+        self._hashes = hashes
+        return "incremental"
+
+    def updated(self, df):
+        """
+        A copy of the store brought up to date with `df` (see `refresh`), this
+        one is left untouched. Returns the new store and how it was updated.
+        """
+        store = copy.copy(self)
+        # `refresh` replaces the partials of a column, it never modifies them
+        store._partials_by_column = {column: dict(partial) for column, partial in self._partials_by_column.items()}
+        return store, store.refresh(df)
+
+    def get(self, column: str, method: str) -> str:
+        return self.payloads[column, method]
+
+
+class CategoryIndex:
+    """
+    Inverted index of the categorical columns: each value points to the sorted
+    positions of the rows holding it.
+
+    Values are indexed by their string form, so boolean columns can be filtered
+    with `"True"` / `"False"`. Categories of one column are combined with a union,
+    several columns with an intersection.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.build(df)
+
+    def build(self, df):
+        index, unique = {}, {}
+        for column in self.columns:
+            index[column] = {str(value): positions for value, positions in df.groupby(column, sort=False, observed=True).indices.items()}
+            unique[column] = pd.Series(df[column].unique()).to_json()
+        self.n_rows = len(df)
+        self.index, self.unique = index, unique
+
+    def unique_values(self, column: str) -> str:
+        return self.unique[column]
+
+    def positions(self, filters: dict):
+        """
+        Sorted row positions matching `{column: [category, ...], ...}`
+        """
+        result = None
+        for column, categories in filters.items():
+            postings = self.index[column]
+            matches = [postings[str(category)] for category in categories if str(category) in postings]
+            column_positions = np.unique(np.concatenate(matches)) if matches else np.empty(0, dtype=np.intp)
+            result = column_positions if result is None else np.intersect1d(result, column_positions, assume_unique=True)
+            if len(result) == 0:
+                break
+        return np.arange(self.n_rows) if result is None else result
+
+
+class QuantileIndex:
+    """
+    Sorted view of every numeric column, built once with `argsort`.
+
+    The quantile of a column is read directly from its sorted values and the
+    rows above or below it are a slice of the permutation, found with a binary
+    search. Rows come back ordered by value, highest first for the top quantile.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.build(df)
+
+    def build(self, df):
+        orders, sorted_values = {}, {}
+        for column in self.columns:
+            values = df[column].to_numpy(dtype=float)
+            order = np.argsort(values, kind="stable")
+            # NaN are sorted last and ignored, like in `Series.quantile`
+            valid = np.count_nonzero(~np.isnan(values))
+            orders[column] = order[:valid]
+            sorted_values[column] = values[order[:valid]]
+        self.orders, self.sorted_values = orders, sorted_values
+
+    def quantile(self, column: str, q: float) -> float:
+        """
+        Same value as `Series.quantile(q)` with linear interpolation
+        """
+        values = self.sorted_values[column]
+        position = (len(values) - 1) * q
+        low = int(np.floor(position))
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    def positions(self, column: str, percent: float, top: bool = True):
+        """
+        Positions of the rows strictly above the `1 - percent` quantile when `top`,
+        strictly below the `percent` quantile otherwise
+        """
+        values = self.sorted_values[column]
+        order = self.orders[column]
+        if len(values) == 0:
+            return order
+        if top:
+            start = np.searchsorted(values, self.quantile(column, 1 - percent), side="right")
+            return order[start:][::-1]
+        end = np.searchsorted(values, self.quantile(column, percent), side="left")
+        return order[:end]
@@ -1,11 +1,29 @@
 import mlflow 
 import uvicorn
+import asyncio
 import json
+import numpy as np
+import orjson
 import pandas as pd 
-from pydantic import BaseModel
-from typing import Literal, List, Union
-from fastapi import FastAPI, File, UploadFile
+from pydantic import BaseModel, Field
+from typing import Literal, List, Dict, NamedTuple
+from fastapi import FastAPI, File, UploadFile, Header, HTTPException, Response, Request
+from fastapi.responses import StreamingResponse
 import os
+import uuid
+import psutil
+from contextlib import asynccontextmanager
+from batching import MicroBatcher
+from workers import WorkerPool
+from streaming import media_types, open_csv, stream_predictions
+from cache import PredictionCache, cache_key
+from model_store import ModelStore
+from model_manager import ModelManager
+from analytics import AggregateStore, CategoryIndex, QuantileIndex
+from dataset import load_pricing_dataset, to_model_frame, categorical_columns as dataset_categorical_columns
+from validation import BatchValidator
+from serialization import negotiate, serialize, media_types as serialization_media_types
+from metrics import Registry, HttpMetrics, MetricsMiddleware, stage, size_buckets, content_type as metrics_content_type
 
 description = """
 GetAround pricing API helps you estimate the daily rental price of a car.
@@ -61,12 +79,25 @@ tags_metadata = [
         "description": "Endpoints that quickly explore dataset"
     },
 
+    {
+        "name": "Admin",
+        "description": "Endpoints that manage the model being served"
+    },
+
     {
         "name": "Predictions",
         "description": "Endpoints that uses our Machine Learning model for detecting attrition"
     }
 ]
 
+@asynccontextmanager
+async def lifespan(app):
+    # Each worker follows the reloads of the dataset made through the others
+    watcher = asyncio.create_task(watch_dataset()) if worker_sync_interval > 0 else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+
 app = FastAPI(
     title="👨‍💼 GetAround Pricing API",
     description=description,
@@ -75,26 +106,118 @@ app = FastAPI(
         "name": "Nizar Sayad - ML Engineer",
         "url": "https://github.com/nizarsayad",
     },
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan,
+)
+
+# Latency of every endpoint and of the stages of the prediction endpoints, exposed on /metrics.
+# Set PROFILE_DIR to dump a flame graph of any request sent with an `X-Profile` header
+# (its value must be ADMIN_TOKEN when one is set)
+registry = Registry(const_labels=lambda: {"pid": os.getpid()})
+http_metrics = HttpMetrics(registry)
+app.add_middleware(
+    MetricsMiddleware,
+    metrics=http_metrics,
+    profile_dir=os.environ.get("PROFILE_DIR") or None,
+    profile_token=os.environ.get("ADMIN_TOKEN") or None,
 )
+batch_rows = registry.histogram("prediction_batch_rows", "Rows sent to the model in one call", ("endpoint",), buckets=size_buckets)
 
 model_name = "getaround_xgbr"
-client = mlflow.MlflowClient()
-model_version = client.get_registered_model(name=model_name).latest_versions[0].version
-model = mlflow.pyfunc.load_model(model_uri=f"models:/{model_name}/{model_version}")
+# Models are downloaded once into a local cache, set MODEL_OFFLINE=1 to boot
+# from the last cached version without contacting the registry
+model_store = ModelStore(os.environ.get("MODEL_CACHE_DIR", "model_cache"))
+model_offline = os.environ.get("MODEL_OFFLINE", "0").lower() in ("1", "true", "yes")
+# Every worker holds its own model and dataset. Pins, rollbacks and dataset reloads are shared
+# on disk and every worker checks for them each WORKER_SYNC_INTERVAL seconds
+worker_sync_interval = float(os.environ.get("WORKER_SYNC_INTERVAL", 1))
+# The registry is polled in the background and new versions are swapped in without restart
+# FAST_PREDICTOR=1 serves predictions from a NumPy export of the pipeline, see fast_predictor.py
+manager = ModelManager(
+    model_store,
+    model_name,
+    poll_interval=0 if model_offline else float(os.environ.get("MODEL_POLL_INTERVAL", 60)),
+    fast_path=os.environ.get("FAST_PREDICTOR", "0").lower() in ("1", "true", "yes"),
+    sync_interval=worker_sync_interval,
+)
+
+def run_model(df):
+    """
+    Top-level wrapper around the active model so it can be sent to a process pool
+    """
+    return manager.predict(df)
+
+# CPU-bound work is kept off the event loop: inference in its own pool,
+# csv parsing and json serialization in a thread pool
+inference_pool = WorkerPool(
+    "inference",
+    kind=os.environ.get("INFERENCE_POOL_KIND", "thread"),
+    max_workers=int(os.environ.get("INFERENCE_POOL_SIZE", 0)) or None,
+)
+io_pool = WorkerPool("io", max_workers=int(os.environ.get("IO_POOL_SIZE", 4)))
+if inference_pool.kind == "process":
+    # Forked workers hold a copy of the model, fork new ones after a swap
+    manager.on_swap.append(lambda info: inference_pool.restart())
+
+# Concurrent /predict calls are coalesced into a single model call
+batcher = MicroBatcher(
+    run_model,
+    max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", 32)),
+    max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", 5)),
+    pool=inference_pool,
+)
+
+# Repeated quotes are answered from memory until the model version changes
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get("PREDICTION_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("PREDICTION_CACHE_TTL", 3600)),
+)
+
+def record_batch(size, frame_seconds, predict_seconds):
+    batch_rows.observe(size, endpoint="/predict")
+    http_metrics.stages.observe(frame_seconds, endpoint="/predict", stage="dataframe")
+    http_metrics.stages.observe(predict_seconds, endpoint="/predict", stage="inference")
+
+batcher.on_batch.append(record_batch)
+
+def cache_metrics():
+    stats = prediction_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+registry.counter("prediction_cache_lookups", "Lookups of the /predict cache", ("result",), collect=cache_metrics)
+registry.gauge("prediction_cache_hit_ratio", "Share of /predict requests answered from the cache", collect=lambda: {(): prediction_cache.stats()["hit_rate"]})
+registry.gauge("prediction_cache_entries", "Predictions held in the cache", collect=lambda: {(): prediction_cache.stats()["size"]})
+registry.gauge(
+    "worker_pool_tasks", "Tasks running or waiting in each worker pool", ("pool", "state"),
+    collect=lambda: {(pool.name, state): pool.stats()[state] for pool in (inference_pool, io_pool) for state in ("active", "queued")},
+)
+registry.gauge(
+    "model_load_seconds", "Time taken to load the model being served", ("version", "stage"),
+    collect=lambda: {(manager.version, step): manager.info.get(f"{step}_seconds") for step in ("fetch", "load", "warmup", "total")},
+)
+registry.gauge(
+    "process_memory_bytes", "Memory of this worker: rss, uss (private to it) and pss (shared pages split between processes)", ("kind",),
+    collect=lambda: {(kind,): getattr(memory, kind, None) for memory in [psutil.Process().memory_full_info()] for kind in ("rss", "uss", "pss")},
+)
+registry.gauge(
+    "model_info", "Model being served", ("version", "source", "fast_path"),
+    collect=lambda: {(manager.version, manager.info["source"], str(manager.info.get("fast_path", False)).lower()): 1},
+)
 
 class GroupBy(BaseModel):
     column: str
     by_method: Literal["mean", "median", "max", "min", "sum", "count"] = "mean"
 
 class FilterBy(BaseModel):
-    column: str
+    column: str = None
     by_category: List[str]= None
+    filters: Dict[str, List[str]] = None
 
 class PredictionFeatures(BaseModel):
     model_key: str
-    mileage: Union[int, float]
-    engine_power: Union[int, float]
+    # The model only takes integers, 100.0 is accepted and 100.5 rejected
+    mileage: int = Field(ge=0, le=2_000_000)
+    engine_power: int = Field(ge=0, le=1_000)
     fuel: str
     paint_color: str
     car_type: str
@@ -106,8 +229,84 @@ class PredictionFeatures(BaseModel):
     has_speed_regulator: bool
     winter_tires: bool
 
-df = pd.read_csv("get_around_pricing_project.csv")
-df.drop(columns=["Unnamed: 0", "rental_price_per_day"], inplace=True)    
+dataset_path = os.environ.get("DATASET_PATH", "get_around_pricing_project.csv")
+dataset_cache_dir = os.environ.get("DATASET_CACHE_DIR", "data_cache")
+# Rewritten by /dataset/reload, workers that see a generation they have not loaded reload too
+generation_path = os.path.join(dataset_cache_dir, "generation")
+
+def load_dataset():
+    # Converted once to a memory-mapped Arrow file with categorical dtypes, see dataset.py
+    data = load_pricing_dataset(dataset_path, dataset_cache_dir)
+    data.drop(columns=["rental_price_per_day"], inplace=True)
+    return data
+
+def read_generation():
+    try:
+        with open(generation_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def write_generation():
+    generation = uuid.uuid4().hex
+    os.makedirs(dataset_cache_dir, exist_ok=True)
+    tmp = f"{generation_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(generation)
+    os.replace(tmp, generation_path)
+    return generation
+
+class Dataset(NamedTuple):
+    """
+    The pricing dataset and the structures built from it. Row positions of the indexes
+    only make sense with their own `df`, so they are always replaced together, with a
+    single assignment of the `dataset` global, and read from the same tuple.
+    """
+    df: pd.DataFrame
+    # Every /groupby answer is precomputed and kept serialized in memory
+    aggregates: AggregateStore
+    # Row positions of every category, /filter-by and /unique-values never scan the dataset
+    category_index: CategoryIndex
+    # Sorted permutation of every numeric column, /quantile is a binary search and a slice
+    quantile_index: QuantileIndex
+
+def index_dataset(data, aggregates):
+    return Dataset(data, aggregates, CategoryIndex(data, categorical_columns), QuantileIndex(data, data.select_dtypes("number").columns))
+
+# Read before the dataset, a reload made while it loads is picked up by the watcher
+dataset_generation = read_generation()
+data = load_dataset()
+categorical_columns = list(data.select_dtypes(exclude="number").columns)
+dataset = index_dataset(data, AggregateStore(data, categorical_columns))
+
+# Batches are checked against PredictionFeatures and the categories the model knows about
+validator = BatchValidator(PredictionFeatures, {column: data[column].cat.categories for column in dataset_categorical_columns})
+
+# Model versions are warmed up (and the fast path checked) on real rows before serving traffic
+manager.sample_data = to_model_frame(data.sample(min(len(data), 256), random_state=0))
+del data
+manager.load(version=os.environ.get("MODEL_VERSION"), offline=model_offline)
+print(f"Loaded {model_name} version {manager.version} from {manager.info['source']} in {manager.info['total_seconds']:.2f}s")
+# Under gunicorn the app is loaded once before forking the workers (see gunicorn.conf.py),
+# each worker then starts its own poller. A swapped model is no longer shared between workers.
+if os.environ.get("PRELOAD_APP") != "1":
+    manager.start_polling()
+
+async def render(frame, output_format=None, accept=None, payload=None, headers=None):
+    """
+    Serialize a dataframe in the format negotiated with the client.
+    The default `json` format keeps returning the `to_json()` string (or a precomputed `payload`),
+    other formats are sent as raw bytes so they are not encoded twice.
+    """
+    output_format = negotiate(output_format, accept)
+    if output_format == "json":
+        return payload if payload is not None else await io_pool.run(frame.to_json)
+    content = await io_pool.run(serialize, frame, output_format)
+    return Response(content=content, media_type=serialization_media_types[output_format], headers=headers)
+
+def json_bytes(content):
+    # Large prediction lists are encoded in the io pool instead of by FastAPI on the event loop
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
 
 @app.get("/verification", tags=["Verification"])
 async def verif_mlflow():
@@ -118,16 +317,136 @@ async def verif_mlflow():
     mlflow_tracking_uri = mlflow.get_tracking_uri()
     mlflow_artifact_uri = mlflow.get_artifact_uri()
 
-    return {"mlflow_tracking_uri": mlflow_tracking_uri, "mlflow_artifact_uri": mlflow_artifact_uri, "track_uri_env": track_uri_env}
+    return {"mlflow_tracking_uri": mlflow_tracking_uri, "mlflow_artifact_uri": mlflow_artifact_uri, "track_uri_env": track_uri_env, "model": manager.info, "model_version": manager.version, "pinned_version": manager.pinned}
+
+@app.get("/metrics", tags=["Verification"])
+async def metrics():
+    """
+    Latency of every endpoint, time spent in each stage of the prediction endpoints
+    (`parse`, `cache`, `batch`, `dataframe`, `validation`, `inference`, `serialize`),
+    batch sizes, cache hit rate, worker pools, model load time and memory, in Prometheus text format.
+    Under gunicorn each worker keeps its own metrics, the `pid` label tells them apart.
+    """
+    return Response(content=registry.render(), media_type=metrics_content_type)
+
+@app.get("/pools", tags=["Verification"])
+async def pools():
+    """
+    Queue depth and counters of the worker pools running inference, csv parsing and json serialization
+    """
+    return {pool.name: pool.stats() for pool in (inference_pool, io_pool)}
+
+@app.get("/cache", tags=["Verification"])
+async def cache_stats():
+    """
+    Hits, misses and evictions of the `/predict` cache
+    """
+    return prediction_cache.stats()
+
+class ModelPin(BaseModel):
+    version: str
+
+def check_admin_token(token):
+    # Admin endpoints are open unless an ADMIN_TOKEN is configured
+    expected = os.environ.get("ADMIN_TOKEN")
+    if expected and token != expected:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+async def swap_dataset():
+    global dataset
+    data = await io_pool.run(load_dataset)
+    # Built aside, requests keep being answered from the current dataset and its indexes until the swap
+    aggregates, refresh = await io_pool.run(dataset.aggregates.updated, data)
+    reloaded = await io_pool.run(index_dataset, data, aggregates)
+    validator.set_categories({column: data[column].cat.categories for column in dataset_categorical_columns})
+    dataset = reloaded
+    return {"rows": len(data), "aggregates": refresh}
+
+async def watch_dataset():
+    """
+    Reload the dataset whenever another worker did, a worker forked before the last reload catches up on its first check
+    """
+    global dataset_generation
+    while True:
+        try:
+            generation = read_generation()
+            if generation != dataset_generation:
+                result = await swap_dataset()
+                # Only once swapped, a failed reload is tried again on the next check
+                dataset_generation = generation
+                print(f"Reloaded the dataset: {result['rows']} rows")
+        except Exception as e:
+            print(f"Dataset reload failed: {e}")
+        await asyncio.sleep(worker_sync_interval)
+
+@app.post("/dataset/reload", tags=["Admin"])
+async def reload_dataset(x_admin_token: str = Header(None)):
+    """
+    Read the pricing dataset again, refresh the precomputed aggregates and rebuild the category and quantile indexes.
+    Rows appended at the end of the file are aggregated incrementally.
+    The other workers reload within `WORKER_SYNC_INTERVAL` seconds.
+    """
+    global dataset_generation
+    check_admin_token(x_admin_token)
+    result = await swap_dataset()
+    # Written and recorded without yielding to the loop, so the watcher of this worker does not reload it again
+    dataset_generation = write_generation()
+    return result
+
+@app.get("/model", tags=["Admin"])
+async def model_status():
+    """
+    Version being served, pinned version and versions served before
+    """
+    return manager.status()
+
+@app.post("/model/pin", tags=["Admin"])
+async def pin_model(modelPin: ModelPin, x_admin_token: str = Header(None)):
+    """
+    Load a given version, swap it in and stop following new registered versions.
+    The other workers follow within `WORKER_SYNC_INTERVAL` seconds, and the pin is kept across restarts until `/model/unpin`.
+    Requires the `X-Admin-Token` header when `ADMIN_TOKEN` is set.
+    """
+    check_admin_token(x_admin_token)
+    try:
+        return await io_pool.run(manager.pin, modelPin.version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not load version {modelPin.version}: {e}")
+
+@app.post("/model/unpin", tags=["Admin"])
+async def unpin_model(x_admin_token: str = Header(None)):
+    """
+    Follow the latest registered version again. If it cannot be loaded right away
+    the current version keeps being served and the error is returned in `refresh_error`.
+    The other workers follow within `WORKER_SYNC_INTERVAL` seconds.
+    """
+    check_admin_token(x_admin_token)
+    return await io_pool.run(manager.unpin)
+
+@app.post("/model/rollback", tags=["Admin"])
+async def rollback_model(x_admin_token: str = Header(None)):
+    """
+    Swap back to the previously served version and pin it, in every worker like `/model/pin`
+    """
+    check_admin_token(x_admin_token)
+    try:
+        return await io_pool.run(manager.rollback)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not load the previous version: {e}")
 
 @app.get("/preview", tags=["Preview"])
-async def random_cars(rows: int=10):
+async def random_cars(rows: int=10, output_format: Literal["json", "records", "csv", "arrow", "parquet"] = None, accept: str = Header(None)):
     """
     Get a sample of your whole dataset. 
     You can specify how many rows you want by specifying a value for `rows`, default is `10`
+
+    Add `output_format` (or an `Accept` header) to get `records` (json list of rows), `csv`, `arrow` (Arrow IPC stream)
+    or `parquet` bytes instead of the default json string.
     """
-    sample = df.sample(rows)
-    return sample.to_json()
+    sample = dataset.df.sample(rows)
+    return await render(sample, output_format, accept)
 
 
 @app.get("/unique-values", tags=["Preview"])
@@ -135,40 +454,55 @@ async def unique_values(column: str):
     """
     Get unique values from a given column 
     """
-    df = pd.Series(df[column].unique())
+    df, _, category_index, _ = dataset
+    if column in category_index.unique:
+        return category_index.unique_values(column)
+    if column not in df.columns:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{column}'")
+
+    values = pd.Series(df[column].unique())
 
-    return df.to_json()
+    return await io_pool.run(values.to_json)
 
 @app.get("/quantile", tags=["Numerical"])
-async def quantile(column: str , percent: float = 0.1, top: bool = True):
+async def quantile(response: Response, column: str , percent: float = 0.1, top: bool = True, offset: int = 0, limit: int = None, output_format: Literal["json", "records", "csv", "arrow", "parquet"] = None, accept: str = Header(None)):
     """
     Get a values of the rental prices dataset according above or below a given quantile. 
     *i.e* with this dataset, you can have the top 10% values of the dataset given a certain column
     
     You can choose whether you want the top quantile or the bottom quantile by specify `top=True` or `top=False`. Default value is `top=True`
     Accepted values for percentage is a float between `0.01` and `0.99`, default is `0.1`
-    """
 
+    Rows are sorted by the value of `column`, highest first for the top quantile. Large results can be paginated
+    with `offset` and `limit`, the total number of rows is returned in the `X-Total-Count` header.
+
+    Add `output_format` (or an `Accept` header) to get `records` (json list of rows), `csv`, `arrow` (Arrow IPC stream)
+    or `parquet` bytes instead of the default json string.
+    """
+    df, _, _, quantile_index = dataset
 
     if percent > 0.99 or percent <0.01:
         msg = "percentage value is not accepted"
         return msg
+    elif column not in quantile_index.orders:
+        raise HTTPException(status_code=400, detail=f"Cannot get quantiles of '{column}', accepted columns are {quantile_index.columns}")
     else:
-        if top:
-            df = df[ df[column] > df[column].quantile(1-percent)]
-        else:
-            df = df[ df[column] < df[column].quantile(percent)]
+        positions = quantile_index.positions(column, percent, top)
+        headers = {"X-Total-Count": str(len(positions))}
+        response.headers.update(headers)
+        end = None if limit is None else offset + max(limit, 0)
+        subset = df.iloc[positions[max(offset, 0):end]]
 
-        return df.to_json()
+        return await render(subset, output_format, accept, headers=headers)
 
 @app.post("/groupby", tags=["Categorical"])
-async def group_by(groupBy: GroupBy):
+async def group_by(groupBy: GroupBy, output_format: Literal["json", "records", "csv", "arrow", "parquet"] = None, accept: str = Header(None)):
     """
     Get data grouped by a given column. Accepted columns are:
 
     * `['model_key', 'fuel', 'paint_color', 'car_type', 'private_parking_available', 'has_gps', 'has_air_conditioning', 'automatic_car', 'has_getaround_connect', 'has_speed_regulator', 'winter_tires']`
 
-    You can use different method to group by category which are:
+    Aggregates are computed once when the dataset is loaded. You can use different method to group by category which are:
 
     * `mean`
     * `median`
@@ -176,28 +510,20 @@ async def group_by(groupBy: GroupBy):
     * `max`
     * `sum`
     * `count`
-    """
-    
 
-    method = groupBy.by_method
+    Add `output_format` (or an `Accept` header) to get `records` (json list of rows), `csv`, `arrow` (Arrow IPC stream)
+    or `parquet` bytes instead of the default json string.
+    """
+    aggregates = dataset.aggregates
 
-    if method=="mean":
-        df = df.groupby(groupBy.column).mean()
-    if method=="median":
-        df = df.groupby(groupBy.column).median()
-    if method=="min":
-        df = df.groupby(groupBy.column).min()
-    if method=="max":
-        df = df.groupby(groupBy.column).max()
-    if method=="sum":
-        df = df.groupby(groupBy.column).sum()
-    if method=="count":
-        df = df.groupby(groupBy.column).count()
+    if (groupBy.column, groupBy.by_method) not in aggregates.payloads:
+        raise HTTPException(status_code=400, detail=f"Cannot group by '{groupBy.column}', accepted columns are {aggregates.columns}")
 
-    return df.to_json()
+    key = (groupBy.column, groupBy.by_method)
+    return await render(aggregates.tables[key], output_format, accept, payload=aggregates.payloads[key])
 
 @app.post("/filter-by", tags=["Categorical"])
-async def filter_by(filterBy: FilterBy):
+async def filter_by(filterBy: FilterBy, output_format: Literal["json", "records", "csv", "arrow", "parquet"] = None, accept: str = Header(None)):
     """
     Filter by one or more categories in a given column. Columns possible values are:
 
@@ -205,19 +531,31 @@ async def filter_by(filterBy: FilterBy):
 
     Check values within dataset to know what kind of `categories` you can filter by. You can use `/unique-values` path to check them out.
     `categories` must be `list` format.
-    """
 
+    Several columns can be filtered at once with `filters`, *e.g* `{"filters": {"fuel": ["diesel"], "car_type": ["suv", "estate"]}}`
+    keeps diesel suvs and estates: categories of one column are combined with OR, columns with AND.
 
-    if filterBy.by_category != None:
-        df = df[df[filterBy.column].isin(filterBy.by_category)]
-        return df.to_json()
+    Add `output_format` (or an `Accept` header) to get `records` (json list of rows), `csv`, `arrow` (Arrow IPC stream)
+    or `parquet` bytes instead of the default json string.
+    """
+    df, _, category_index, _ = dataset
+    filters = dict(filterBy.filters or {})
+    if filterBy.column is not None and filterBy.by_category is not None:
+        filters[filterBy.column] = filterBy.by_category
+
+    if filters:
+        unknown = [column for column in filters if column not in category_index.index]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Cannot filter by {unknown}, accepted columns are {category_index.columns}")
+        subset = df.iloc[category_index.positions(filters)]
+        return await render(subset, output_format, accept)
     else:
         msg = "Please chose a column to filter by"
         return msg
 
 
 @app.post("/predict", tags=["Machine-Learning"])
-async def predict(predictionFeatures: PredictionFeatures):
+async def predict(predictionFeatures: PredictionFeatures, request: Request):
     """
     Prediction for one observation. Endpoint will return a dictionnary like this:
 
@@ -226,29 +564,139 @@ async def predict(predictionFeatures: PredictionFeatures):
     ```
 
     You need to give this endpoint all columns values as dictionnary, or form data.
-    """
-    # Read data 
-    df = pd.DataFrame(dict(predictionFeatures), index=[0])
 
-    prediction = model.predict(df)
+    Concurrent requests are grouped in micro-batches (see `BATCH_MAX_SIZE` and `BATCH_MAX_WAIT_MS`)
+    and sent to the model together, each caller still gets its own prediction.
+    Predictions are cached per model version (see `PREDICTION_CACHE_SIZE` and `PREDICTION_CACHE_TTL`).
+    """
+    with stage(request, "validation"):
+        # Same checks and coercion as the batch endpoints, they accept and reject the same cars
+        features, errors = validator.validate_record(dict(predictionFeatures))
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    with stage(request, "cache"):
+        key = cache_key(features)
+        version = manager.version
+        prediction = prediction_cache.get(key, version)
+    if prediction is None:
+        # Time spent waiting for the micro-batch, its dataframe and inference are recorded by the batcher
+        with stage(request, "batch"):
+            prediction = await batcher.submit(features)
+        prediction_cache.set(key, prediction, version)
 
     # Format response
-    response = {"prediction": prediction.tolist()[0]}
+    response = {"prediction": prediction}
     return response
 
 
+async def predict_batch(batch, request=None, endpoint="/batch-predict"):
+    """
+    Validate a batch column-wise and predict its valid rows. Returns the predictions,
+    `None` for invalid rows, and the errors of each row, `None` for valid rows.
+    Stages are timed when the `request` is given.
+    """
+    with stage(request, "validation"):
+        clean, valid, errors = await io_pool.run(validator.validate, batch)
+    batch_rows.observe(int(valid.sum()), endpoint=endpoint)
+    with stage(request, "inference"):
+        if valid.all():
+            predictions = (await inference_pool.run(run_model, clean)).tolist()
+        else:
+            predictions = np.full(len(clean), None, dtype=object)
+            if valid.any():
+                predictions[valid] = (await inference_pool.run(run_model, clean[valid])).tolist()
+            predictions = predictions.tolist()
+    return predictions, validator.row_errors(errors, len(clean))
+
+
 @app.post("/batch-predict", tags=["Machine-Learning"])
-async def batch_predict(file: UploadFile = File(...)):
+async def batch_predict(request: Request, file: UploadFile = File(...), stream: bool = False, output_format: Literal["ndjson", "csv"] = "ndjson", chunksize: int = None):
     """
     Make prediction on a batch of observation. This endpoint accepts only **csv files** containing 
     all the trained columns WITHOUT the target variable. 
-    """
-    # Read file 
-    df = pd.read_csv(file.file)
 
-    predictions = model.predict(df)
+    The whole file is validated before any prediction: if some rows have missing values, wrong types,
+    values out of range or unknown categories, the endpoint answers `422` with the errors of each invalid row.
+    An empty or unparsable file is answered with a `422`, a file with only a header with `[]`.
+
+    With `stream=True` the file is read `chunksize` rows at a time (default `BATCH_CHUNK_SIZE`, `10000`)
+    and predictions are streamed back chunk by chunk, one `{"row": ..., "prediction": ...}` object per line
+    with `output_format=ndjson` or as `row,prediction,errors` lines with `output_format=csv`.
+    Invalid rows are streamed with their errors instead of a prediction.
+    An empty or unparsable file, or missing columns, are answered with a `422` before streaming starts,
+    an error in the middle of the stream ends it with an `{"error": ...}` line, or in csv with a row
+    without row number nor prediction whose `errors` field is `error: <message>`.
+    Memory usage stays the same whatever the size of the file.
+    """
+    if stream:
+        chunksize = chunksize or int(os.environ.get("BATCH_CHUNK_SIZE", 10000))
+        # The header and first chunk are read before the response starts, an empty or
+        # unparsable file or missing columns are still answered with a 422
+        try:
+            reader, first = await open_csv(file.file, io_pool, chunksize=chunksize, columns=list(validator.fields))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return StreamingResponse(
+            stream_predictions(reader, first, predict_batch, io_pool, output_format=output_format),
+            media_type=media_types[output_format],
+        )
+
+    # An empty or unparsable file raises a ValueError (pandas' EmptyDataError, ParserError) like missing columns
+    try:
+        with stage(request, "dataframe"):
+            batch = await io_pool.run(pd.read_csv, file.file)
+        with stage(request, "validation"):
+            clean, valid, errors = await io_pool.run(validator.validate, batch)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if batch.empty:
+        # A header without rows, as an empty list on /batch-predict-json, the model is not called
+        return Response(content=b"[]", media_type="application/json")
+    if not valid.all():
+        row_errors = validator.row_errors(errors, len(batch))
+        raise HTTPException(status_code=422, detail=[{"row": row, "errors": row_errors[row]} for row in np.flatnonzero(~valid).tolist()])
+
+    batch_rows.observe(len(clean), endpoint="/batch-predict")
+    with stage(request, "inference"):
+        predictions = await inference_pool.run(run_model, clean)
+
+    content = await io_pool.run(json_bytes, np.asarray(predictions).tolist())
+    return Response(content=content, media_type="application/json")
+
+
+@app.post("/batch-predict-json", tags=["Machine-Learning"], openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/PredictionFeatures"}}}},
+    }
+})
+async def batch_predict_json(request: Request):
+    """
+    Make predictions on a json list of cars, each one with the same fields as `/predict`.
+    Rows are validated together, column by column, invalid rows do not prevent the others from being predicted:
 
-    return predictions.tolist()
+    ```
+    {"predictions": [PREDICTION_VALUE or null, ...], "errors": [null or {"column": "message"}, ...]}
+    ```
+    """
+    try:
+        with stage(request, "parse"):
+            records = orjson.loads(await request.body())
+        with stage(request, "dataframe"):
+            batch = pd.DataFrame.from_records(records) if isinstance(records, list) else None
+    except (orjson.JSONDecodeError, TypeError, ValueError):
+        batch = None
+    if batch is None:
+        raise HTTPException(status_code=422, detail="Expected a json list of cars")
+    if batch.empty:
+        return {"predictions": [], "errors": []}
+
+    try:
+        predictions, errors = await predict_batch(batch, request, endpoint="/batch-predict-json")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    content = await io_pool.run(json_bytes, {"predictions": predictions, "errors": errors})
+    return Response(content=content, media_type="application/json")
 
 #if __name__=="__main__":
 #    uvicorn.run(app, host="0.0.0.0", port=4000, debug=True, reload=True)
\ No newline at end of file
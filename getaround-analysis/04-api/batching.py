@@ -0,0 +1,111 @@
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-row predictions into one model call.
+
+    Requests are queued and a background task collects them until either
+    `max_batch_size` rows are waiting or `max_wait_ms` milliseconds have passed
+    since the first row of the batch arrived. The batch is then sent to
+    `predict_fn` as a single DataFrame and each caller gets back its own row.
+    When a `pool` is given, `predict_fn` runs in it instead of the event loop
+    and up to `pool.max_workers` batches are predicted at the same time.
+
+    When the model call fails, e.g. on a row the model rejects, the rows of the
+    batch are predicted one by one and only the callers of the failing rows get
+    the error.
+
+    Callbacks of `on_batch` are called after each batch with its size and the
+    seconds spent building the DataFrame and predicting.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 32, max_wait_ms: float = 5, pool=None):
+        self.predict_fn = predict_fn
+        self.pool = pool
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._tasks = set()
+        self.on_batch = []
+
+    def _ensure_worker(self):
+        # The queue and worker belong to the running event loop, so they are
+        # (re)created lazily whenever we are called from a new loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, features: dict):
+        """
+        Queue one observation and wait for its prediction
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((features, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Whatever is already waiting goes in the same batch, up to the limit
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _predict(self, df):
+        if self.pool is None:
+            return self.predict_fn(df)
+        return await self.pool.run(self.predict_fn, df)
+
+    async def _dispatch(self, batch):
+        start = time.perf_counter()
+        df = pd.DataFrame([features for features, _ in batch])
+        built = time.perf_counter()
+        try:
+            predictions = np.asarray(await self._predict(df)).tolist()
+        except Exception as e:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # One bad row fails the whole call, each row is predicted on its own
+            # so only the callers whose row fails get the error
+            await asyncio.gather(*(self._dispatch([item]) for item in batch))
+            return
+        predicted = time.perf_counter()
+
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+        for callback in self.on_batch:
+            callback(len(batch), built - start, predicted - built)
+
+    async def _run(self):
+        # Each batch is predicted in its own task so several model calls are in flight,
+        # up to one per worker of the pool. While every worker is busy requests keep
+        # queueing, the next batch is collected once one is free and is therefore fuller
+        slots = asyncio.Semaphore(self.pool.max_workers if self.pool is not None else 1)
+        while True:
+            await slots.acquire()
+            batch = await self._collect()
+            task = self._loop.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
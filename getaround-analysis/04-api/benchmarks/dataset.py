@@ -0,0 +1,77 @@
+"""
+Load time and memory of the pricing dataset, csv vs memory-mapped Arrow.
+
+Each loader runs in a fresh interpreter. `frame_mb` is what pandas reports for
+the dataframe, `uss_mb` is the memory private to the process after loading:
+pages of the memory-mapped Arrow file are shared with every other worker and
+do not count in it.
+
+    python benchmarks/dataset.py --output dataset.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+probe = """
+import json, sys, time, psutil
+import pandas as pd
+import dataset
+process = psutil.Process()
+before = process.memory_full_info()
+start = time.perf_counter()
+if sys.argv[1] == "csv":
+    df = pd.read_csv(sys.argv[2])
+else:
+    df = dataset.load_pricing_dataset(sys.argv[2], sys.argv[3])
+seconds = time.perf_counter() - start
+after = process.memory_full_info()
+print(json.dumps({
+    "load_seconds": seconds,
+    "frame_mb": df.memory_usage(deep=True).sum() / 2**20,
+    "rss_mb": (after.rss - before.rss) / 2**20,
+    "uss_mb": (after.uss - before.uss) / 2**20,
+}))
+"""
+
+
+def run(loader: str, csv_path: str, cache_dir: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", probe, loader, csv_path, cache_dir],
+        cwd=API_DIR, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["loader"] = loader
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=os.path.join(API_DIR, "get_around_pricing_project.csv"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # First call converts the csv, the following ones only map the Arrow file
+        results.append({**run("arrow", args.csv, cache_dir), "loader": "arrow (convert)"})
+        for _ in range(args.repeat):
+            results.append(run("csv", args.csv, cache_dir))
+            results.append(run("arrow", args.csv, cache_dir))
+
+    for result in results:
+        print(f"{result['loader']:>16}: {result['load_seconds'] * 1000:8.1f} ms, frame {result['frame_mb']:6.2f} MB, "
+              f"rss +{result['rss_mb']:6.2f} MB, private +{result['uss_mb']:6.2f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Load test of the pricing API.
+
+Starts the API with uvicorn against a stand-in model, sends synthetic traffic
+to each endpoint at several concurrency levels and reports, per endpoint and
+concurrency, the throughput, p50/p95/p99 latency, errors and memory (RSS) of
+the server.
+
+The stand-in model is the pipeline of `03-machine-learning/pricing_project.ipynb`
+trained on `get_around_pricing_project.csv` and registered in a temporary
+file-based mlflow store, so no tracking server is needed. Pass `--tracking-uri`
+to benchmark a model already registered somewhere else instead.
+
+Cars sent to the prediction endpoints are drawn from the distributions of the
+csv: categories and booleans with their observed frequencies, mileage and
+engine power from the observed values with some noise. Columns are drawn
+independently from each other.
+
+    python benchmarks/load.py --concurrency 1 8 32 --duration 10 --output load.json
+    python benchmarks/load.py --endpoints predict --env FAST_PREDICTOR=1 --output fast.json
+
+Needs httpx and psutil on top of the API requirements.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+import pandas as pd
+import psutil
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(API_DIR, "get_around_pricing_project.csv")
+# The stand-in model uses the functions of the training pipelines
+sys.path.insert(0, os.path.join(os.path.dirname(API_DIR), "03-machine-learning"))
+import preprocessing  # noqa: E402
+
+numeric_columns = ["mileage", "engine_power"]
+categorical_columns = ["model_key", "fuel", "paint_color", "car_type"]
+bool_columns = [
+    "private_parking_available", "has_gps", "has_air_conditioning", "automatic_car",
+    "has_getaround_connect", "has_speed_regulator", "winter_tires",
+]
+
+
+def register_stand_in_model(tracking_uri: str, model_name: str = "getaround_xgbr"):
+    """
+    Train the notebook pipeline on the whole csv and register it in `tracking_uri`
+    """
+    import mlflow
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+    from xgboost import XGBRegressor
+
+    data = pd.read_csv(DATASET, index_col=0)
+    X, Y = data.drop(columns="rental_price_per_day"), data["rental_price_per_day"]
+    preprocessor = ColumnTransformer([
+        ("num", StandardScaler(), numeric_columns),
+        ("cat", OneHotEncoder(drop="first", handle_unknown="ignore"), categorical_columns),
+        ("bool", FunctionTransformer(preprocessing.bool_to_numeric), bool_columns),
+    ])
+    model = Pipeline([
+        ("preprocessor", preprocessor),
+        ("regressor", XGBRegressor(n_estimators=200, max_depth=7, eta=0.1, subsample=0.7, colsample_bytree=0.8, alpha=0.1, random_state=42)),
+    ])
+    model.fit(X, Y)
+
+    # The API cannot import `preprocessing`, its functions are saved by value with the model
+    import cloudpickle
+    cloudpickle.register_pickle_by_value(preprocessing)
+    mlflow.set_tracking_uri(tracking_uri)
+    try:
+        with mlflow.start_run():
+            mlflow.sklearn.log_model(
+                model, name="model", registered_model_name=model_name,
+                input_example=X.head(), serialization_format="cloudpickle",
+            )
+    finally:
+        cloudpickle.unregister_pickle_by_value(preprocessing)
+
+
+def synthetic_cars(data: pd.DataFrame, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    `n` cars drawn column by column from the distributions of `data`
+    """
+    cars = {}
+    for column in categorical_columns:
+        frequencies = data[column].value_counts(normalize=True)
+        cars[column] = rng.choice(frequencies.index.to_numpy(), size=n, p=frequencies.to_numpy())
+    for column in numeric_columns:
+        values = data[column].to_numpy()
+        noise = rng.lognormal(0, 0.1, size=n)
+        cars[column] = np.clip(np.rint(rng.choice(values, size=n) * noise), 0, None).astype(np.int64)
+    for column in bool_columns:
+        cars[column] = rng.random(n) < data[column].mean()
+    # Same column order as the dataset and PredictionFeatures
+    return pd.DataFrame(cars)[[column for column in data.columns if column in cars]]
+
+
+def scenarios(data: pd.DataFrame, rng: np.random.Generator, batch_size: int, distinct: int) -> dict:
+    """
+    Request factories of each endpoint, `factory(i)` returns the arguments of the i-th request
+    """
+    cars = synthetic_cars(data, distinct, rng).to_dict(orient="records")
+    for car in cars:
+        # numpy scalars are not json serializable
+        for column in numeric_columns:
+            car[column] = int(car[column])
+        for column in bool_columns:
+            car[column] = bool(car[column])
+    batches = [synthetic_cars(data, batch_size, rng) for _ in range(8)]
+    batch_records = [json.loads(batch.to_json(orient="records")) for batch in batches]
+    batch_csvs = [batch.to_csv(index=False).encode("utf-8") for batch in batches]
+    model_keys = data["model_key"].value_counts().index[:3].tolist()
+
+    return {
+        "predict": lambda i: ("POST", "/predict", {"json": cars[i % len(cars)]}),
+        "batch-predict-json": lambda i: ("POST", "/batch-predict-json", {"json": batch_records[i % len(batch_records)]}),
+        "batch-predict": lambda i: ("POST", "/batch-predict", {"files": {"file": ("cars.csv", batch_csvs[i % len(batch_csvs)], "text/csv")}}),
+        "preview": lambda i: ("GET", "/preview", {"params": {"rows": 10}}),
+        "unique-values": lambda i: ("GET", "/unique-values", {"params": {"column": categorical_columns[i % len(categorical_columns)]}}),
+        "groupby": lambda i: ("POST", "/groupby", {"json": {"column": categorical_columns[i % len(categorical_columns)], "by_method": "mean"}}),
+        "filter-by": lambda i: ("POST", "/filter-by", {"json": {"column": "model_key", "by_category": model_keys[: 1 + i % len(model_keys)]}}),
+        "quantile": lambda i: ("GET", "/quantile", {"params": {"column": numeric_columns[i % 2], "percent": 0.1, "top": bool(i % 2)}}),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, env: dict, timeout: float = 300):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The API exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/pools", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("The API did not start in time")
+
+
+def rss_mb(process: psutil.Process) -> float:
+    # Worker processes (INFERENCE_POOL_KIND=process) are counted too
+    processes = [process] + process.children(recursive=True)
+    total = 0
+    for p in processes:
+        try:
+            total += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total / 2**20
+
+
+async def run_level(client: httpx.AsyncClient, factory, concurrency: int, duration: float, process: psutil.Process) -> dict:
+    latencies, statuses = [], {}
+    counter = iter(range(sys.maxsize))
+    peak_rss = rss_mb(process)
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            method, url, kwargs = factory(next(counter))
+            start = time.perf_counter()
+            try:
+                status = str((await client.request(method, url, **kwargs)).status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def watch_memory():
+        nonlocal peak_rss
+        while time.perf_counter() < deadline:
+            peak_rss = max(peak_rss, rss_mb(process))
+            await asyncio.sleep(0.2)
+
+    start = time.perf_counter()
+    await asyncio.gather(watch_memory(), *(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+        "statuses": statuses,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(latencies.mean()) if len(latencies) else None,
+        "peak_rss_mb": peak_rss,
+        "rss_mb": rss_mb(process),
+    }
+
+
+async def run_benchmark(port: int, endpoints: dict, concurrency_levels, duration: float, warmup: float, process: psutil.Process):
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        for name, factory in endpoints.items():
+            await run_level(client, factory, 1, warmup, process)
+            for concurrency in concurrency_levels:
+                result = {"endpoint": name, **await run_level(client, factory, concurrency, duration, process)}
+                results.append(result)
+                print(f"{name:>20} x{concurrency:<4} {result['throughput_rps']:9.1f} req/s  "
+                      f"p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  "
+                      f"errors {result['errors']:<5} rss {result['rss_mb']:7.1f}MB (peak {result['peak_rss_mb']:.1f}MB)")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=API_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", help="endpoints to benchmark, all of them by default")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="concurrent clients of each run")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of each run")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of warm up before each endpoint")
+    parser.add_argument("--batch-size", type=int, default=100, help="cars per request of the batch endpoints")
+    parser.add_argument("--distinct", type=int, default=100000, help="distinct cars sent to /predict, lower it to hit the prediction cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracking-uri", help="use the model registered there instead of a stand-in model")
+    parser.add_argument("--env", nargs="*", default=[], metavar="NAME=VALUE", help="environment variables of the API, e.g. FAST_PREDICTOR=1")
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = pd.read_csv(DATASET, index_col=0)
+    endpoints = scenarios(data, rng, args.batch_size, args.distinct)
+    if args.endpoints:
+        unknown = set(args.endpoints) - set(endpoints)
+        if unknown:
+            parser.error(f"unknown endpoints {sorted(unknown)}, choose among {list(endpoints)}")
+        endpoints = {name: endpoints[name] for name in args.endpoints}
+    api_env = dict(variable.split("=", 1) for variable in args.env)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            "MODEL_CACHE_DIR": os.path.join(workdir, "model_cache"),
+            "DATASET_CACHE_DIR": os.path.join(workdir, "data_cache"),
+            "MODEL_POLL_INTERVAL": "0",
+        }
+        if args.tracking_uri:
+            env["MLFLOW_TRACKING_URI"] = args.tracking_uri
+        else:
+            env["MLFLOW_TRACKING_URI"] = f"file://{os.path.join(workdir, 'mlruns')}"
+            # Recent mlflow versions only accept a file store when asked to
+            env["MLFLOW_ALLOW_FILE_STORE"] = "true"
+            os.environ["MLFLOW_ALLOW_FILE_STORE"] = "true"
+            print("Training the stand-in model")
+            register_stand_in_model(env["MLFLOW_TRACKING_URI"])
+        env.update(api_env)
+
+        port = free_port()
+        server = start_server(port, env)
+        try:
+            process = psutil.Process(server.pid)
+            idle_rss = rss_mb(process)
+            results = asyncio.run(run_benchmark(port, endpoints, args.concurrency, args.duration, args.warmup, process))
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "settings": {**vars(args), "env": api_env},
+            "idle_rss_mb": idle_rss,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Payload size and serialization time of the analytics response formats,
+measured on the pricing dataset.
+
+`json (legacy)` is what the endpoints returned before: the `df.to_json()`
+string encoded a second time by FastAPI.
+
+    python benchmarks/serialization.py --output serialization.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from dataset import load_pricing_dataset
+from serialization import serialize, serializers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=os.path.join(API_DIR, "get_around_pricing_project.csv"))
+    parser.add_argument("--rows", type=int, default=None, help="only serialize the first rows")
+    parser.add_argument("--number", type=int, default=20, help="serializations timed per format")
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        frame = load_pricing_dataset(args.csv, cache_dir).copy()
+    if args.rows:
+        frame = frame.head(args.rows)
+
+    candidates = {"json (legacy)": lambda: json.dumps(frame.to_json()).encode("utf-8")}
+    for output_format in serializers:
+        candidates[output_format] = lambda output_format=output_format: serialize(frame, output_format)
+
+    results = []
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number
+        results.append({"format": name, "rows": len(frame), "bytes": len(fn()), "milliseconds": seconds * 1000})
+
+    for result in results:
+        print(f"{result['format']:>14}: {result['bytes'] / 1024:9.1f} KB, {result['milliseconds']:7.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup benchmark of the pricing API.
+
+Imports `app` in a fresh interpreter for each scenario and reports how long the
+import took and where the model came from:
+
+* `cold`: empty model cache, the model is downloaded from the registry
+* `warm`: the model is already in the local cache
+* `offline`: `MODEL_OFFLINE=1`, the registry is never contacted
+
+Run it from the `04-api` directory with `MLFLOW_TRACKING_URI` set, a local
+file store such as `file:///tmp/mlruns` works as a stand-in for the tracking server:
+
+    python benchmarks/startup.py --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+probe = """
+import json, time
+start = time.perf_counter()
+import app
+print(json.dumps({"import_seconds": time.perf_counter() - start, "model": app.manager.info}))
+"""
+
+
+def run_scenario(name: str, env: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=API_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["scenario"] = name
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="number of warm and offline runs")
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = {"MODEL_CACHE_DIR": cache_dir}
+        results.append(run_scenario("cold", env))
+        for _ in range(args.repeat):
+            results.append(run_scenario("warm", env))
+        for _ in range(args.repeat):
+            results.append(run_scenario("offline", {**env, "MODEL_OFFLINE": "1"}))
+
+    for result in results:
+        model = result["model"]
+        print(f"{result['scenario']:>8}: import {result['import_seconds']:.2f}s, "
+              f"model {model['total_seconds']:.2f}s (fetch {model['fetch_seconds']:.2f}s, load {model['load_seconds']:.2f}s) from {model['source']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Memory of the API served by gunicorn, per worker, with and without preloading.
+
+For each number of workers the server is started twice, with `PRELOAD_APP=1`
+(the app is loaded once and the workers are forked from it) and with
+`PRELOAD_APP=0` (every worker loads its own model and dataset). After some
+traffic, every process reports:
+
+* `rss_mb`: resident memory, shared pages included, summing it over-counts
+* `uss_mb`: memory private to the process, what one more worker costs
+* `pss_mb`: shared pages split between the processes sharing them, the sum
+  over all processes is the real footprint of the server
+
+Like `load.py` it runs against a stand-in model unless `--tracking-uri` is given:
+
+    python benchmarks/workers.py --workers 1 2 4 --output workers.json
+
+Needs gunicorn, uvicorn-worker, httpx and psutil.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+import pandas as pd
+import psutil
+from load import API_DIR, DATASET, free_port, register_stand_in_model, scenarios
+
+
+def start_gunicorn(port: int, workers: int, env: dict, timeout: float = 300):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+        cwd=API_DIR,
+        env={**os.environ, **env, "PORT": str(port), "WEB_CONCURRENCY": str(workers)},
+    )
+    process = psutil.Process(server.pid)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            ready = httpx.get(f"http://127.0.0.1:{port}/pools", timeout=1).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        # Without preloading, workers come up one by one
+        if ready and len(process.children()) == workers:
+            return server
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def memory(process: psutil.Process) -> dict:
+    info = process.memory_full_info()
+    return {"pid": process.pid, "rss_mb": info.rss / 2**20, "uss_mb": info.uss / 2**20, "pss_mb": info.pss / 2**20}
+
+
+def measure(port: int, workers: int, preload: bool, env: dict, endpoints: dict, requests: int) -> dict:
+    server = start_gunicorn(port, workers, {**env, "PRELOAD_APP": "1" if preload else "0"})
+    try:
+        # Touch every endpoint so lazily allocated memory is counted
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            for i in range(requests):
+                for factory in endpoints.values():
+                    method, url, kwargs = factory(i)
+                    client.request(method, url, **kwargs)
+        master = psutil.Process(server.pid)
+        processes = {"master": memory(master), "workers": [memory(worker) for worker in master.children()]}
+    finally:
+        server.terminate()
+        server.wait()
+
+    every = [processes["master"]] + processes["workers"]
+    return {
+        "workers": workers,
+        "preload": preload,
+        **processes,
+        "total_rss_mb": sum(p["rss_mb"] for p in every),
+        "total_pss_mb": sum(p["pss_mb"] for p in every),
+        "mean_worker_uss_mb": float(np.mean([p["uss_mb"] for p in processes["workers"]])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4], help="numbers of workers to measure")
+    parser.add_argument("--requests", type=int, default=20, help="requests sent to each endpoint before measuring")
+    parser.add_argument("--tracking-uri", help="use the model registered there instead of a stand-in model")
+    parser.add_argument("--output", help="json file where results are saved")
+    args = parser.parse_args()
+
+    endpoints = scenarios(pd.read_csv(DATASET, index_col=0), np.random.default_rng(0), batch_size=100, distinct=1000)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            "MODEL_CACHE_DIR": os.path.join(workdir, "model_cache"),
+            "DATASET_CACHE_DIR": os.path.join(workdir, "data_cache"),
+            "MODEL_POLL_INTERVAL": "0",
+        }
+        if args.tracking_uri:
+            env["MLFLOW_TRACKING_URI"] = args.tracking_uri
+        else:
+            env["MLFLOW_TRACKING_URI"] = f"file://{os.path.join(workdir, 'mlruns')}"
+            env["MLFLOW_ALLOW_FILE_STORE"] = "true"
+            os.environ["MLFLOW_ALLOW_FILE_STORE"] = "true"
+            print("Training the stand-in model")
+            register_stand_in_model(env["MLFLOW_TRACKING_URI"])
+
+        for workers in args.workers:
+            for preload in (True, False):
+                result = measure(free_port(), workers, preload, env, endpoints, args.requests)
+                results.append(result)
+                print(f"{workers:>3} workers, preload {'on ' if preload else 'off'}: "
+                      f"total pss {result['total_pss_mb']:7.1f}MB, rss {result['total_rss_mb']:7.1f}MB, "
+                      f"per worker uss {result['mean_worker_uss_mb']:6.1f}MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+categorical_columns = ["model_key", "fuel", "paint_color", "car_type"]
+# Bumped whenever `read_pricing_csv` changes, Arrow copies converted by an older version are not reused
+conversion_version = 2
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_pricing_csv(csv_path: str):
+    """
+    Parse the pricing csv with compact dtypes: text columns become ordered
+    categoricals (so `min`/`max` keep working), flags are parsed as booleans.
+    Rows with a negative mileage or engine power, entry errors that `/predict`
+    rejects, are dropped.
+    """
+    data = pd.read_csv(csv_path)
+    data.drop(columns=["Unnamed: 0"], inplace=True, errors="ignore")
+    data = data[(data["mileage"] >= 0) & (data["engine_power"] >= 0)].reset_index(drop=True)
+    for column in categorical_columns:
+        data[column] = pd.Categorical(data[column], categories=sorted(data[column].dropna().unique()), ordered=True)
+    return data
+
+
+def columnar_path(csv_path: str, cache_dir: str) -> str:
+    """
+    Arrow file holding the converted csv, named after the csv content and the
+    conversion version so any change to either produces a new file
+    """
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f"{stem}.{file_digest(csv_path)[:16]}.v{conversion_version}.arrow")
+
+
+def load_pricing_dataset(csv_path: str, cache_dir: str = "data_cache"):
+    """
+    Load the pricing dataset from its Arrow copy, converting the csv the first time.
+
+    The Arrow file is uncompressed and memory-mapped: numeric columns are read
+    without copy straight from the page cache, which every worker process on the
+    machine shares, instead of each holding its own parsed copy of the csv.
+    """
+    path = columnar_path(csv_path, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(read_pricing_csv(csv_path), tmp, compression="uncompressed")
+        os.replace(tmp, path)
+
+    # The map stays open as long as the dataframe references its buffers
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def to_model_frame(df):
+    """
+    Categoricals back to plain strings, the dtypes the model was trained with
+    """
+    return df.astype({column: object for column in categorical_columns if column in df.columns})
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+small_batch = 256
+
+
+class FastPredictor:
+    """
+    Lean inference path for the `preprocessor -> XGBRegressor` pipeline trained
+    in `03-machine-learning/pricing_project.ipynb`, skipping the mlflow pyfunc
+    wrapper and the sklearn ColumnTransformer.
+
+    Preprocessing is exported once into NumPy lookup tables: scaling is a fused
+    `(x - mean) / scale`, each one-hot encoded column is an index lookup into its
+    categories and booleans are cast. The features are written into one dense
+    float matrix given straight to the booster.
+
+    When the pipeline produced sparse matrices, XGBoost treated every zero as a
+    missing value, zeros are therefore replaced by NaN to get the same trees paths.
+    """
+
+    def __init__(self, pipeline):
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            raise ValueError("Expected a Pipeline(preprocessor, regressor)")
+        preprocessor, self.regressor = pipeline.steps[0][1], pipeline.steps[1][1]
+        if not isinstance(preprocessor, ColumnTransformer) or not hasattr(self.regressor, "get_booster"):
+            raise ValueError("Expected a ColumnTransformer followed by an XGBoost model")
+
+        self.blocks = []
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            if isinstance(transformer, StandardScaler):
+                mean = transformer.mean_ if transformer.mean_ is not None else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.scale_ is not None else np.ones(len(columns))
+                self.blocks.append(("num", list(columns), offset, (mean, scale)))
+                offset += len(columns)
+            elif isinstance(transformer, OneHotEncoder):
+                lookups = []
+                for i, categories in enumerate(transformer.categories_):
+                    drop = transformer.drop_idx_[i] if transformer.drop_idx_ is not None else None
+                    # Output column of each category, -1 for the dropped one
+                    targets = np.arange(len(categories))
+                    if drop is not None:
+                        targets = np.where(targets > drop, targets - 1, targets)
+                        targets[drop] = -1
+                    lookups.append((pd.Index(categories), dict(zip(categories, targets)), offset, targets))
+                    offset += len(categories) - (drop is not None)
+                self.blocks.append(("cat", list(columns), None, lookups))
+            elif isinstance(transformer, FunctionTransformer):
+                # Boolean flags cast to 0 / 1
+                self.blocks.append(("bool", list(columns), offset, None))
+                offset += len(columns)
+            else:
+                raise ValueError(f"Unsupported transformer {name}: {transformer}")
+        self.n_features = offset
+        self.sparse = bool(getattr(preprocessor, "sparse_output_", False))
+
+    def transform(self, df):
+        X = np.zeros((len(df), self.n_features), dtype=np.float64)
+        rows = np.arange(len(df))
+        for kind, columns, offset, params in self.blocks:
+            if kind == "cat":
+                for column, (categories, lookup, start, targets) in zip(columns, params):
+                    values = np.asarray(df[column], dtype=object)
+                    if len(values) <= small_batch:
+                        # A dict lookup beats building a pandas index for a few rows
+                        target = np.fromiter((lookup.get(value, -1) for value in values), dtype=np.intp, count=len(values))
+                    else:
+                        positions = categories.get_indexer(values)
+                        found = positions >= 0
+                        target = np.full(len(values), -1)
+                        target[found] = targets[positions[found]]
+                    hot = target >= 0
+                    X[rows[hot], start + target[hot]] = 1.0
+                continue
+            # Column by column, selecting several columns of a dataframe at once is much slower
+            for j, column in enumerate(columns):
+                X[:, offset + j] = np.asarray(df[column], dtype=np.float64)
+            if kind == "num":
+                mean, scale = params
+                X[:, offset:offset + len(columns)] -= mean
+                X[:, offset:offset + len(columns)] /= scale
+        if self.sparse:
+            X[X == 0] = np.nan
+        return X
+
+    def predict(self, df):
+        return self.regressor.predict(self.transform(df))
+
+    def check(self, model, df, rtol: float = 1e-5, atol: float = 1e-3) -> float:
+        """
+        Compare with the predictions of the full `model` on `df`, raise if they differ.
+        Returns the largest absolute difference.
+        """
+        expected = np.asarray(model.predict(df), dtype=np.float64)
+        got = np.asarray(self.predict(df), dtype=np.float64)
+        if not np.allclose(got, expected, rtol=rtol, atol=atol):
+            raise ValueError(f"Fast path differs from the model by up to {np.abs(got - expected).max()}")
+        return float(np.abs(got - expected).max()) if len(df) else 0.0
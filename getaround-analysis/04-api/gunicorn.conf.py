@@ -0,0 +1,71 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    gunicorn app:app --config gunicorn.conf.py
+
+The app is imported once in the master process (`preload_app`) and the workers
+are forked from it, so the model, the pricing dataframe and the analytics
+indexes are shared copy-on-write instead of being loaded by every worker.
+Objects are frozen out of the garbage collector before forking, otherwise a
+collection in a worker writes to every object it visits and unshares its page.
+
+Models swapped in and datasets reloaded afterwards are held by each worker,
+and an admin request reaches only one of them. That worker shares the change on
+disk, pins, unpins and rollbacks in `MODEL_CACHE_DIR` and dataset reloads in
+`DATASET_CACHE_DIR`, and the others, those forked later included, follow within
+`WORKER_SYNC_INTERVAL` seconds. Until then `/model` may answer differently
+depending on the worker.
+
+On SIGTERM workers stop accepting connections and are given `GRACEFUL_TIMEOUT`
+seconds to finish the requests in flight.
+
+Settings (environment variables):
+
+* `PORT`: port to listen on (default `80`)
+* `WEB_CONCURRENCY`: number of workers (default: number of cpus)
+* `GRACEFUL_TIMEOUT`: seconds given to workers to drain on shutdown (default `30`)
+* `WORKER_TIMEOUT`: seconds after which a silent worker is killed and replaced (default `60`)
+* `MAX_REQUESTS`: recycle a worker after that many requests, `0` never does (default `0`)
+* `WORKER_SYNC_INTERVAL`: seconds between two checks of the admin changes made through other workers (default `1`)
+* `PRELOAD_APP`: `0` loads the app in each worker instead, only useful to measure the memory saved (default `1`)
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 80)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 0)) or os.cpu_count() or 1
+worker_class = "uvicorn_worker.UvicornWorker"
+# PRELOAD_APP=0 lets every worker load its own app, to compare memory usage
+preload_app = os.environ.setdefault("PRELOAD_APP", "1") == "1"
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = 5
+max_requests = int(os.environ.get("MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def when_ready(server):
+    # The app is loaded and no worker is forked yet
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    import app
+
+    # Threads do not survive a fork, the app did not start its poller in the master (see PRELOAD_APP)
+    # and each worker gets fresh pools
+    app.inference_pool.restart()
+    app.io_pool.restart()
+    app.manager.start_polling()
+
+
+def worker_exit(server, worker):
+    import app
+
+    app.manager.stop_polling()
+    app.inference_pool.shutdown(wait=False)
+    app.io_pool.shutdown(wait=False)
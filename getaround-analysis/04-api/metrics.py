@@ -0,0 +1,305 @@
+import abc
+import bisect
+import os
+import threading
+import time
+from profiler import SamplingProfiler
+
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+size_buckets = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Values another object already keeps are read at scrape time from
+        # `collect()`, which returns `{label values tuple: value}`
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _items(self):
+        if self.collect is not None:
+            return list(self.collect().items())
+        with self._lock:
+            return list(self._values.items())
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self):
+        """
+        `(suffix, labels, value)` of every series
+        """
+
+    def render(self, const_labels: dict = None) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            if const_labels:
+                labels = {**const_labels, **labels}
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [("_total", dict(zip(self.labelnames, key)), value) for key, value in self._items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [("", dict(zip(self.labelnames, key)), value) for key, value in self._items() if value is not None]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=latency_buckets):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Counts are kept per bucket and accumulated at scrape time
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append(("_bucket", {**labels, "le": format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class Registry:
+    """
+    `const_labels()` returns labels added to every series, it is called at
+    scrape time so it can hold values that change after a fork, e.g. the pid
+    """
+
+    def __init__(self, const_labels=None):
+        self.metrics = []
+        self.const_labels = const_labels
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), collect=None):
+        return self.register(Counter(name, help, labelnames, collect))
+
+    def gauge(self, name, help, labelnames=(), collect=None):
+        return self.register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name, help, labelnames=(), buckets=latency_buckets):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format
+        """
+        const_labels = self.const_labels() if self.const_labels is not None else None
+        return "\n".join(metric.render(const_labels) for metric in self.metrics) + "\n"
+
+
+class StageTimer:
+    """
+    Time the stages of one request. It is created by `MetricsMiddleware` and
+    reached from an endpoint through `request.state.timer`.
+
+    Everything before the first stage (reading the body, pydantic parsing) is
+    recorded as `parse`, and everything between the end of the last stage and
+    the start of the response (building and encoding the response) as `serialize`.
+    """
+
+    def __init__(self, start: float):
+        self.start = start
+        self.last = None
+        self.stages = []
+
+    def stage(self, name: str):
+        return _Stage(self, name)
+
+    def add(self, name: str, seconds: float):
+        self.stages.append((name, seconds))
+
+
+class _Stage:
+    def __init__(self, timer: StageTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        if self.timer.last is None:
+            if self.name == "parse":
+                # An endpoint parsing its own body, the time before it is part of the stage
+                self.begin = self.timer.start
+            else:
+                self.timer.add("parse", self.begin - self.timer.start)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.last = time.perf_counter()
+        self.timer.add(self.name, self.timer.last - self.begin)
+
+
+def stage(request, name: str):
+    """
+    `with stage(request, "inference"): ...`, does nothing without a request or outside of `MetricsMiddleware`
+    """
+    timer = getattr(request.state, "timer", None) if request is not None else None
+    return timer.stage(name) if timer is not None else _NoStage()
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class HttpMetrics:
+    """
+    Metrics recorded by `MetricsMiddleware`, `stages` is shared with code timing
+    stages outside of a request (e.g. a micro-batch serving several requests)
+    """
+
+    def __init__(self, registry: Registry):
+        self.requests = registry.counter("http_requests", "Requests handled", ("method", "endpoint", "status"))
+        self.latency = registry.histogram("http_request_duration_seconds", "Time from request to the last byte of the response", ("method", "endpoint"))
+        self.in_flight = registry.gauge("http_requests_in_flight", "Requests being handled")
+        self.stages = registry.histogram("http_request_stage_seconds", "Time spent in each stage of a request", ("endpoint", "stage"))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every request, from the first byte
+    received to the last byte sent (streamed responses included), and the stages
+    timed by the endpoint. Requests are labelled with their route path, not the
+    raw url, so the number of series stays bounded.
+
+    When `profile_dir` is set, a request sent with an `X-Profile` header (equal to
+    `profile_token` if one is given) is sampled by a `SamplingProfiler` and its
+    stacks are written to `profile_dir` in folded format, ready for flamegraph.pl
+    or speedscope. The file name is returned in the `X-Profile-File` header.
+    """
+
+    def __init__(self, app, metrics: HttpMetrics, profile_dir: str = None, profile_token: str = None, profile_interval: float = 0.001):
+        self.app = app
+        self.metrics = metrics
+        self.profile_dir = profile_dir
+        self.profile_token = profile_token
+        self.profile_interval = profile_interval
+
+    def _wants_profile(self, scope) -> bool:
+        if self.profile_dir is None:
+            return False
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(b"x-profile")
+        if token is None:
+            return False
+        return self.profile_token is None or token.decode("latin-1") == self.profile_token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timer = StageTimer(start)
+        scope.setdefault("state", {})["timer"] = timer
+        profiler = SamplingProfiler(self.profile_interval) if self._wants_profile(scope) else None
+        profile_file = None
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile_file = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(timer):x}.folded")
+            profiler.start()
+
+        status = 500
+        response_start = None
+
+        async def send_wrapper(message):
+            nonlocal status, response_start
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_start = time.perf_counter()
+                if profile_file is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", os.path.basename(profile_file).encode())]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight.inc(-1)
+            end = time.perf_counter()
+            endpoint = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            metrics.requests.inc(method=method, endpoint=endpoint, status=status)
+            metrics.latency.observe(end - start, method=method, endpoint=endpoint)
+            if timer.stages:
+                # Streamed responses start before their stages are over, there is no serialize stage
+                if response_start is not None and timer.last is not None and response_start >= timer.last:
+                    timer.add("serialize", response_start - timer.last)
+                for name, seconds in timer.stages:
+                    metrics.stages.observe(seconds, endpoint=endpoint, stage=name)
+            if profiler is not None:
+                profiler.stop()
+                profiler.dump(profile_file)
@@ -0,0 +1,231 @@
+import threading
+import time
+from fast_predictor import FastPredictor
+
+
+class ModelManager:
+    """
+    Hold the model currently served and swap it without downtime.
+
+    A background thread polls the registry every `poll_interval` seconds. A new
+    version is loaded and warmed up off the request path, then swapped in with a
+    single assignment, requests in flight finish on the model they started with.
+    A version can be pinned, in which case polling no longer changes it, and
+    the previous version can be rolled back to.
+
+    Pins, unpins and rollbacks are shared through the store: every process
+    serving from it (e.g. the gunicorn workers) checks the pinned version every
+    `sync_interval` seconds and follows it. A pin made this way lasts, restarts
+    included, until it is unpinned or the API boots with an explicit version.
+
+    `sample_data` is used to warm up each new version. With `fast_path=True`
+    the pipeline is also exported to a `FastPredictor`, checked against the
+    full model on `sample_data` and used for predictions if they match.
+    """
+
+    def __init__(self, store, model_name: str, poll_interval: float = 60, sample_data=None, fast_path: bool = False, sync_interval: float = 1):
+        self.store = store
+        self.model_name = model_name
+        self.poll_interval = poll_interval
+        self.sync_interval = sync_interval
+        self.sample_data = sample_data
+        self.fast_path = fast_path
+        self.pinned = None
+        # Pinned version of the store last applied by this process
+        self.shared_pin = None
+        self.history = []
+        self.on_swap = []
+        self._active = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def model(self):
+        return self._active[0]
+
+    @property
+    def info(self) -> dict:
+        return self._active[1]
+
+    @property
+    def version(self) -> str:
+        return self._active[1]["version"]
+
+    def predict(self, df):
+        return self._active[2].predict(df)
+
+    def _export(self, model, info):
+        # Any pipeline the fast path does not support falls back to the pyfunc model
+        try:
+            predictor = FastPredictor(model.get_raw_model())
+            if self.sample_data is not None:
+                info["fast_path_max_error"] = predictor.check(model, self.sample_data)
+        except Exception as e:
+            info["fast_path"] = False
+            info["fast_path_error"] = str(e)
+            return model
+        info["fast_path"] = True
+        return predictor
+
+    def _load(self, version=None, offline: bool = False):
+        model, info = self.store.load(self.model_name, version=version, offline=offline)
+        predictor = self._export(model, info) if self.fast_path else model
+        if self.sample_data is not None:
+            start = time.perf_counter()
+            predictor.predict(self.sample_data)
+            info["warmup_seconds"] = time.perf_counter() - start
+        return model, info, predictor
+
+    def _swap(self, model, info, predictor):
+        previous = self._active
+        self._active = (model, info, predictor)
+        if previous is not None and previous[1]["version"] != info["version"]:
+            if self.history and self.history[-1] == info["version"]:
+                # Back to the version served before, the one we leave must not become the next rollback target
+                self.history.pop()
+            else:
+                self.history.append(previous[1]["version"])
+            for callback in self.on_swap:
+                callback(info)
+
+    def load(self, version=None, offline: bool = False):
+        """
+        Load the first model, blocking. Without `version`, the version pinned in the store is loaded if any.
+        An explicit `version` replaces that pin
+        """
+        with self._lock:
+            shared = self.store.pinned_version(self.model_name)
+            if version is None:
+                version = shared
+            elif shared is not None:
+                if shared != str(version):
+                    print(f"Serving version {version} asked at boot instead of version {shared} pinned in {self.store.root}, the pin is removed")
+                self.store.set_pinned(self.model_name, None)
+                shared = None
+            self.shared_pin = shared
+            self._swap(*self._load(version, offline))
+            if version is not None:
+                self.pinned = str(version)
+
+    def refresh(self) -> bool:
+        """
+        Swap in the latest registered version if it changed, returns whether a swap happened
+        """
+        with self._lock:
+            if self.pinned is not None:
+                return False
+            latest = str(self.store.resolve_version(self.model_name))
+            if latest == self.version:
+                return False
+            self._swap(*self._load(latest))
+            return True
+
+    def _pin(self, version):
+        with self._lock:
+            version = str(version)
+            if version != self.version:
+                self._swap(*self._load(version))
+            self.pinned = version
+
+    def _share(self, version):
+        with self._lock:
+            self.store.set_pinned(self.model_name, version)
+            self.shared_pin = version
+
+    def pin(self, version) -> dict:
+        """
+        Serve `version` and stop following the registry, in every process
+        """
+        self._pin(version)
+        self._share(str(version))
+        return self.status()
+
+    def unpin(self) -> dict:
+        """
+        Follow the latest registered version again. When the latest version
+        cannot be loaded right away the current one keeps being served, the
+        poller tries again later and the error is reported in `refresh_error`.
+        """
+        self._share(None)
+        with self._lock:
+            self.pinned = None
+        try:
+            self.refresh()
+        except Exception as e:
+            return {**self.status(), "refresh_error": str(e)}
+        return self.status()
+
+    def rollback(self) -> dict:
+        """
+        Go back to the previously served version and pin it, in every process
+        """
+        with self._lock:
+            if not self.history:
+                raise ValueError("No previous version to roll back to")
+            version = self.history[-1]
+            # A failed load leaves the history, and the rollback target, untouched
+            self._swap(*self._load(version))
+            self.pinned = version
+        self._share(version)
+        return self.status()
+
+    def sync(self) -> bool:
+        """
+        Follow a pin, unpin or rollback made by another process, returns whether the version served changed
+        """
+        shared = self.store.pinned_version(self.model_name)
+        if shared == self.shared_pin:
+            return False
+        version = self.version
+        if shared is None:
+            with self._lock:
+                self.pinned = None
+            self.shared_pin = None
+            # If the latest version cannot be loaded now the poller tries again later, as after `unpin`
+            self.refresh()
+        else:
+            self._pin(shared)
+            # Only once loaded, a failed load is tried again on the next sync
+            self.shared_pin = shared
+        return self.version != version
+
+    def status(self) -> dict:
+        return {
+            "active": self.info,
+            "pinned": self.pinned,
+            "history": list(self.history),
+            "poll_interval": self.poll_interval,
+            "polling": self._thread is not None and self._thread.is_alive(),
+        }
+
+    def _poll(self):
+        # Synced right away, a worker forked after a pin catches up before its first tick
+        next_refresh = time.monotonic() + self.poll_interval
+        while True:
+            if self.sync_interval > 0:
+                try:
+                    if self.sync():
+                        print(f"Swapped to {self.model_name} version {self.version} (pinned: {self.pinned})")
+                except Exception as e:
+                    print(f"Model sync failed: {e}")
+            if self.poll_interval > 0 and time.monotonic() >= next_refresh:
+                next_refresh = time.monotonic() + self.poll_interval
+                try:
+                    if self.refresh():
+                        print(f"Swapped to {self.model_name} version {self.version}")
+                except Exception as e:
+                    print(f"Model polling failed: {e}")
+            wait = min(interval for interval in (self.sync_interval, self.poll_interval) if interval > 0)
+            if self._stop.wait(wait):
+                return
+
+    def start_polling(self):
+        if (self.poll_interval <= 0 and self.sync_interval <= 0) or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name="model-poller", daemon=True)
+        self._thread.start()
+
+    def stop_polling(self):
+        self._stop.set()
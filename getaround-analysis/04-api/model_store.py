@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import mlflow
+
+
+class ModelStore:
+    """
+    On-disk, content-addressed cache of registered mlflow models.
+
+    Artifacts are stored once under `objects/<sha256>` and each registered
+    version points to its artifacts through `refs/<model_name>/<version>`.
+    `refs/<model_name>/latest` remembers the last version resolved from the
+    registry, it is what the API boots from when the registry is unreachable.
+    `refs/<model_name>/pinned` holds the version pinned through the API, every
+    process serving from the same store follows it.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.refs = os.path.join(root, "refs")
+
+    def _ref_path(self, model_name: str, ref: str) -> str:
+        return os.path.join(self.refs, model_name, str(ref))
+
+    def _read_ref(self, model_name: str, ref: str):
+        try:
+            with open(self._ref_path(model_name, ref)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _write_ref(self, model_name: str, ref: str, value: str):
+        path = self._ref_path(model_name, ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a crash never leaves a half written ref
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+    def _remove_ref(self, model_name: str, ref: str):
+        try:
+            os.remove(self._ref_path(model_name, ref))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def digest(path: str) -> str:
+        """
+        sha256 of every file of a directory, relative paths included
+        """
+        sha = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                sha.update(os.path.relpath(file_path, path).encode("utf-8"))
+                with open(file_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(block)
+        return sha.hexdigest()
+
+    def cached_path(self, model_name: str, version):
+        """
+        Local path of a cached version, `None` if it has never been downloaded
+        """
+        digest = self._read_ref(model_name, version)
+        if digest is None:
+            return None
+        path = os.path.join(self.objects, digest)
+        return path if os.path.isdir(path) else None
+
+    def latest_cached_version(self, model_name: str):
+        return self._read_ref(model_name, "latest")
+
+    def pinned_version(self, model_name: str):
+        return self._read_ref(model_name, "pinned")
+
+    def set_pinned(self, model_name: str, version=None):
+        """
+        Share the pinned version with every process using this store, `None` removes the pin
+        """
+        if version is None:
+            self._remove_ref(model_name, "pinned")
+        else:
+            self._write_ref(model_name, "pinned", str(version))
+
+    def fetch(self, model_name: str, version) -> str:
+        """
+        Download a version from the registry into the store and return its local path
+        """
+        os.makedirs(self.objects, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.objects, prefix=".download-")
+        try:
+            local = mlflow.artifacts.download_artifacts(artifact_uri=f"models:/{model_name}/{version}", dst_path=tmp)
+            digest = self.digest(local)
+            path = os.path.join(self.objects, digest)
+            if not os.path.isdir(path):
+                os.replace(local, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._write_ref(model_name, version, digest)
+        return path
+
+    def resolve_version(self, model_name: str):
+        """
+        Latest registered version of a model
+        """
+        client = mlflow.MlflowClient()
+        return client.get_registered_model(name=model_name).latest_versions[0].version
+
+    def load(self, model_name: str, version=None, offline: bool = False):
+        """
+        Load a model, downloading it only if it is not cached yet.
+
+        Without `version`, the latest registered version is used. If the registry
+        cannot be reached, or `offline=True`, the last cached version is loaded instead.
+        Returns the model and a dict describing where it came from and how long it took.
+        """
+        start = time.perf_counter()
+        source = "cache"
+        if version is None and not offline:
+            try:
+                version = self.resolve_version(model_name)
+            except Exception as e:
+                print(f"Model registry unreachable ({e}), falling back to the local model cache")
+        if version is None:
+            version = self.latest_cached_version(model_name)
+            if version is None:
+                raise RuntimeError(f"No cached version of '{model_name}' in {self.root} to boot from")
+
+        path = self.cached_path(model_name, version)
+        if path is None:
+            if offline:
+                raise RuntimeError(f"Version {version} of '{model_name}' is not cached in {self.root}")
+            path = self.fetch(model_name, version)
+            source = "registry"
+        resolved = time.perf_counter()
+
+        model = mlflow.pyfunc.load_model(path)
+        self._write_ref(model_name, "latest", str(version))
+        end = time.perf_counter()
+
+        return model, {
+            "model_name": model_name,
+            "version": str(version),
+            "source": source,
+            "path": path,
+            "fetch_seconds": resolved - start,
+            "load_seconds": end - resolved,
+            "total_seconds": end - start,
+        }
@@ -0,0 +1,65 @@
+import collections
+import os
+import sys
+import threading
+
+
+class SamplingProfiler:
+    """
+    Sample the python stack of every thread each `interval` seconds from a
+    background thread, with no tracing overhead on the code being profiled.
+
+    The event loop thread and the thread pools are sampled together, so work
+    of other requests running at the same time shows up as well. Work done in
+    a process pool (`INFERENCE_POOL_KIND=process`) is not visible.
+
+    Stacks are counted in folded format, one `thread;outer;...;inner count`
+    line per distinct stack, as read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.folded())
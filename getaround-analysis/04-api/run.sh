@@ -2,6 +2,7 @@ docker run -it \
 -v "$(pwd):/home/app" \
 -p 80:80 \
 --restart always \
+--stop-timeout 40 \
 -e AWS_ACCESS_KEY_ID=$AWS_ACCESS_KEY_ID \
 -e AWS_SECRET_ACCESS_KEY=$AWS_SECRET_ACCESS_KEY \
 -e BACKEND_STORE_URI=$BACKEND_STORE_URI \
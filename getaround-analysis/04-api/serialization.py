@@ -0,0 +1,73 @@
+import io
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# `json` is the historical `df.to_json()` string, every other format is sent as raw bytes
+media_types = {
+    "json": "application/json",
+    "records": "application/json",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+accepted = {
+    "text/csv": "csv",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+}
+
+
+def negotiate(output_format: str = None, accept: str = None) -> str:
+    """
+    Format of a response: `output_format` when given, otherwise the first
+    binary or csv media type of the `Accept` header, `json` by default
+    """
+    if output_format:
+        return output_format
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip().lower()
+        if media_type in accepted:
+            return accepted[media_type]
+    return "json"
+
+
+def to_records(frame) -> bytes:
+    # Index (row id or group key) is kept as a regular column. Columns are turned
+    # into python lists in one go each, much faster than `to_dict(orient="records")`
+    frame = frame.reset_index()
+    names = [str(name) for name in frame.columns]
+    columns = [frame[name].tolist() for name in frame.columns]
+    return orjson.dumps([dict(zip(names, row)) for row in zip(*columns)])
+
+
+def to_arrow(frame) -> bytes:
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_parquet(frame) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(frame), buffer)
+    return buffer.getvalue()
+
+
+def to_csv(frame) -> bytes:
+    return frame.to_csv().encode("utf-8")
+
+
+serializers = {
+    "json": lambda frame: frame.to_json().encode("utf-8"),
+    "records": to_records,
+    "csv": to_csv,
+    "arrow": to_arrow,
+    "parquet": to_parquet,
+}
+
+
+def serialize(frame, output_format: str) -> bytes:
+    return serializers[output_format](frame)
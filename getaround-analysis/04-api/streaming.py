@@ -0,0 +1,96 @@
+import json
+import pandas as pd
+
+media_types = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def csv_errors(error) -> str:
+    if error is None:
+        return ""
+    # Quoted so commas in messages stay in one field
+    return json.dumps("; ".join(f"{column}: {message}" for column, message in error.items()))
+
+
+def format_chunk(predictions, errors, start: int, output_format: str, header: bool = False) -> str:
+    """
+    Format the predictions of one chunk, rows are numbered from `start`.
+    Invalid rows have no prediction and carry their validation errors.
+    """
+    rows = range(start, start + len(predictions))
+    if output_format == "csv":
+        lines = [
+            f"{row},{'' if prediction is None else prediction},{csv_errors(error)}"
+            for row, prediction, error in zip(rows, predictions, errors)
+        ]
+        if header:
+            lines.insert(0, "row,prediction,errors")
+    else:
+        lines = [
+            json.dumps({"row": row, "prediction": prediction} if error is None else {"row": row, "prediction": None, "errors": error})
+            for row, prediction, error in zip(rows, predictions, errors)
+        ]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def format_error(message: str, output_format: str, header: bool = False) -> str:
+    """
+    Last line of a stream that failed: an `{"error": ...}` object in ndjson, in csv a
+    row without a row number nor a prediction, whose `errors` field holds the message
+    """
+    if output_format == "csv":
+        return ("row,prediction,errors\n" if header else "") + f",,{json.dumps('error: ' + message)}\n"
+    return json.dumps({"error": message}) + "\n"
+
+
+async def open_csv(file, io_pool, chunksize: int = 10000, columns=()):
+    """
+    Open a chunked reader of a csv file and read its first chunk, before the
+    response starts so a bad upload can still be answered with an error status.
+
+    Raises a `ValueError` when the file is empty or cannot be parsed, or when its
+    header lacks some of `columns`. Returns the reader and the first chunk.
+    """
+    reader = await io_pool.run(lambda: pd.read_csv(file, chunksize=chunksize))
+    try:
+        first = await io_pool.run(next, reader, None)
+        missing_columns = [column for column in columns if column not in first.columns]
+        if missing_columns:
+            raise ValueError(f"Missing columns {missing_columns}")
+    except BaseException:
+        reader.close()
+        raise
+    return reader, first
+
+
+async def stream_predictions(reader, first, predict_chunk, io_pool, output_format: str = "ndjson"):
+    """
+    Yield the formatted predictions of each chunk of `reader`, starting with the
+    already read `first` one, as soon as they are ready so only one chunk is held
+    in memory.
+
+    `predict_chunk(chunk)` is a coroutine returning the predictions and the
+    per-row validation errors of a chunk. The response has already started, so
+    any error while reading or predicting is reported as a last line, in the
+    format of the stream (see `format_error`).
+    """
+    start = 0
+    chunk = first
+    try:
+        while chunk is not None:
+            # A file with only a header reads as one empty chunk
+            if len(chunk):
+                predictions, errors = await predict_chunk(chunk)
+                yield format_chunk(predictions, errors, start, output_format, header=start == 0)
+                start += len(predictions)
+            chunk = await io_pool.run(next, reader, None)
+        if start == 0 and output_format == "csv":
+            yield "row,prediction,errors\n"
+    except Exception as e:
+        # Validation errors explain themselves, anything else is named
+        message = str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+        yield format_error(message, output_format, header=start == 0)
+    finally:
+        reader.close()
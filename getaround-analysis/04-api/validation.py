@@ -0,0 +1,177 @@
+import math
+import typing
+import numpy as np
+import pandas as pd
+
+true_values = ["true", "1", "1.0", "yes", "t", "y"]
+false_values = ["false", "0", "0.0", "no", "f", "n"]
+
+
+def field_kind(annotation) -> str:
+    args = typing.get_args(annotation)
+    if annotation is bool:
+        return "bool"
+    if annotation is int:
+        return "integer"
+    if annotation in (int, float) or (args and all(arg in (int, float) for arg in args)):
+        return "number"
+    return "str"
+
+
+def field_range(field):
+    # Bounds declared with `Field(ge=..., le=..., gt=..., lt=...)`
+    low, high, low_strict, high_strict = -np.inf, np.inf, False, False
+    for constraint in field.metadata:
+        if getattr(constraint, "ge", None) is not None:
+            low = constraint.ge
+        if getattr(constraint, "gt", None) is not None:
+            low, low_strict = constraint.gt, True
+        if getattr(constraint, "le", None) is not None:
+            high = constraint.le
+        if getattr(constraint, "lt", None) is not None:
+            high, high_strict = constraint.lt, True
+    return low, high, low_strict, high_strict
+
+
+def range_message(low, high, low_strict, high_strict) -> str:
+    bounds = []
+    if low != -np.inf:
+        bounds.append(f"{'>' if low_strict else '>='} {low}")
+    if high != np.inf:
+        bounds.append(f"{'<' if high_strict else '<='} {high}")
+    return "must be " + " and ".join(bounds)
+
+
+class BatchValidator:
+    """
+    Column-wise validation of a whole batch against a pydantic schema.
+
+    Every check (missing value, type, numeric range, known category) is a
+    vectorized mask over a column, no row is ever looped over in Python.
+    Values are coerced to the dtypes the model expects on the way.
+    """
+
+    def __init__(self, schema, categories: dict = None):
+        self.fields = {name: (field_kind(field.annotation), field_range(field)) for name, field in schema.model_fields.items()}
+        self.categories = {}
+        self.set_categories(categories or {})
+
+    def set_categories(self, categories: dict):
+        categories = {column: pd.Index(values).astype(str) for column, values in categories.items()}
+        self.categories, self.category_sets = categories, {column: frozenset(values) for column, values in categories.items()}
+
+    def validate(self, df):
+        """
+        Returns the coerced batch, a boolean mask of the valid rows and the errors
+        as `{column: [(row positions, message), ...]}`. Missing columns raise a `ValueError`.
+        """
+        missing_columns = [name for name in self.fields if name not in df.columns]
+        if missing_columns:
+            raise ValueError(f"Missing columns {missing_columns}")
+
+        n = len(df)
+        valid = np.ones(n, dtype=bool)
+        errors = {}
+        clean = {}
+
+        def fail(column, mask, message):
+            if mask.any():
+                errors.setdefault(column, []).append((np.flatnonzero(mask), message))
+                valid[mask] = False
+
+        for name, (kind, (low, high, low_strict, high_strict)) in self.fields.items():
+            column = df[name]
+            missing = column.isna().to_numpy()
+            fail(name, missing, "missing value")
+
+            if kind in ("number", "integer"):
+                values = pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64)
+                fail(name, np.isnan(values) & ~missing, "must be a number")
+                checked = ~np.isnan(values)
+                out_of_range = checked & ((values <= low) if low_strict else (values < low))
+                out_of_range |= checked & ((values >= high) if high_strict else (values > high))
+                fail(name, out_of_range, range_message(low, high, low_strict, high_strict))
+                # Invalid rows are never predicted so their value does not matter
+                values = np.where(checked & ~out_of_range, values, 0)
+                if kind == "integer":
+                    # The model signature only accepts integers: 100.0 is 100, 100.7 is an error
+                    fail(name, values != np.floor(values), "must be an integer")
+                    values = np.where(values == np.floor(values), values, 0).astype(np.int64)
+                clean[name] = values
+
+            elif kind == "bool":
+                if column.dtype == bool:
+                    clean[name] = column.to_numpy()
+                    continue
+                text = column.astype(str).str.strip().str.lower()
+                is_true = text.isin(true_values).to_numpy()
+                is_false = text.isin(false_values).to_numpy()
+                fail(name, ~(is_true | is_false) & ~missing, "must be a boolean")
+                clean[name] = is_true
+
+            else:
+                text = column.astype(str)
+                clean[name] = text.to_numpy(dtype=object)
+                if name in self.categories:
+                    unknown = ~text.isin(self.categories[name]).to_numpy() & ~missing
+                    fail(name, unknown, "unknown category")
+
+        return pd.DataFrame(clean, index=df.index), valid, errors
+
+    def validate_record(self, record: dict):
+        """
+        Same checks, messages and coercion as `validate` for a single record, without
+        building a DataFrame. Returns the coerced record and its errors `{column: message}`.
+        """
+        missing_columns = [name for name in self.fields if name not in record]
+        if missing_columns:
+            raise ValueError(f"Missing columns {missing_columns}")
+
+        clean, errors = {}, {}
+        for name, (kind, (low, high, low_strict, high_strict)) in self.fields.items():
+            value = record[name]
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                errors[name] = "missing value"
+                continue
+
+            if kind in ("number", "integer"):
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    errors[name] = "must be a number"
+                    continue
+                if (number <= low if low_strict else number < low) or (number >= high if high_strict else number > high):
+                    errors[name] = range_message(low, high, low_strict, high_strict)
+                elif kind == "integer" and number != math.floor(number):
+                    errors[name] = "must be an integer"
+                else:
+                    clean[name] = int(number) if kind == "integer" else number
+
+            elif kind == "bool":
+                text = value if isinstance(value, bool) else str(value).strip().lower()
+                if isinstance(text, bool) or text in true_values or text in false_values:
+                    clean[name] = text if isinstance(text, bool) else text in true_values
+                else:
+                    errors[name] = "must be a boolean"
+
+            else:
+                clean[name] = str(value)
+                if name in self.category_sets and clean[name] not in self.category_sets[name]:
+                    errors[name] = "unknown category"
+
+        return clean, errors
+
+    @staticmethod
+    def row_errors(errors: dict, n: int):
+        """
+        Errors as a list aligned with the batch: `None` for valid rows, `{column: message}` otherwise.
+        Only the invalid rows are visited.
+        """
+        by_row = [None] * n
+        for column, checks in errors.items():
+            for rows, message in checks:
+                for row in rows.tolist():
+                    if by_row[row] is None:
+                        by_row[row] = {}
+                    by_row[row].setdefault(column, message)
+        return by_row
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class WorkerPool:
+    """
+    Run blocking, CPU-bound work (inference, csv parsing, json serialization)
+    outside of the event loop.
+
+    `kind` is either `"thread"` or `"process"`. Functions sent to a process pool
+    must be importable top-level functions, on Linux the workers are forked so
+    they share the model already loaded by the parent.
+    """
+
+    def __init__(self, name: str, kind: str = "thread", max_workers: int = None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind '{kind}', expected 'thread' or 'process'")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = self._new_executor()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _new_executor(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            if not future.cancelled() and future.exception() is not None:
+                self._failed += 1
+
+    async def run(self, fn, *args):
+        """
+        Submit `fn(*args)` to the pool and wait for its result
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """
+        Queue depth and counters of the pool
+        """
+        with self._lock:
+            active = min(self._in_flight, self.max_workers)
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "active": active,
+                "queued": self._in_flight - active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def restart(self):
+        """
+        Replace the workers, jobs already submitted finish on the old ones.
+        New process workers are forked from the current state of the parent,
+        e.g. after the model was swapped.
+        """
+        previous, self._executor = self._executor, self._new_executor()
+        previous.shutdown(wait=False)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)